@@ -0,0 +1,476 @@
+"""
+Copyright (c) 2024 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from werkzeug.serving import make_server
+import importlib.util
+import threading
+import requests
+import logging
+import hashlib
+import base64
+import random
+import click
+import json
+import time
+import sys
+import os
+
+SITE_SERVICE = "services/sites.json"
+VPN_SERVICE = "services/vpns.json"
+
+MIXES = {
+    "read-heavy": {
+        "list_sites": 45,
+        "list_vpns": 25,
+        "get_site": 15,
+        "get_vpn": 10,
+        "patch_site": 3,
+        "patch_vpn": 2,
+    },
+    "write-burst": {
+        "list_sites": 10,
+        "post_site": 30,
+        "patch_site": 25,
+        "patch_vpn": 15,
+        "delete_site": 20,
+    },
+    "commit-storm": {
+        "list_sites": 20,
+        "patch_site": 20,
+        "infra_diff": 30,
+        "infra_commit": 30,
+    },
+}
+
+
+class ServiceDbStub:
+    """
+    This class is a local stand-in for the RESTCONF service database holding sites and VPNs in memory.
+    It supports the requests made by ServiceDb including the RESTCONF fields query parameter.
+    """
+
+    def __init__(self, sites=int) -> None:
+        self.lock = threading.Lock()
+        self.data = {
+            "sites": {
+                id: {
+                    "id": id,
+                    "name": f"site-{id:02d}",
+                    "type": "DC" if id == 1 else "Branch",
+                    "router": [f"C8K-{id:08X}"],
+                    "switches": [f"BRK2357S{id:02d}S"],
+                }
+                for id in range(1, sites + 1)
+            },
+            "vpns": {
+                id: {"id": id, "name": f"VPN{id}", "sites": ["DC", "Branch"]}
+                for id in range(100, 111)
+            },
+        }
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body=None):
+                content = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/yang-data+json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def target(self):
+                url = urlparse(self.path)
+                resource = url.path.split("/restconf/data/")[-1]
+                module, _, key = resource.partition("=")
+                collection = module.split(":")[-1]
+                if collection not in stub.data:
+                    return None, None, parse_qs(url.query)
+                return collection, int(key) if key else None, parse_qs(url.query)
+
+            def body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                collection, key, query = self.target()
+                if collection is None:
+                    return self.reply(404, {"error": "unknown resource"})
+                with stub.lock:
+                    if key is None:
+                        items = list(stub.data[collection].values())
+                    elif key in stub.data[collection]:
+                        items = [stub.data[collection][key]]
+                    else:
+                        return self.reply(404, {"error": "not found"})
+                if "fields" in query:
+                    fields = query["fields"][0].split(";")
+                    items = [
+                        {k: item[k] for k in fields if k in item} for item in items
+                    ]
+                self.reply(200, {collection: items})
+
+            def do_POST(self):
+                collection, _, _ = self.target()
+                if collection is None:
+                    return self.reply(404, {"error": "unknown resource"})
+                with stub.lock:
+                    for item in self.body()[collection]:
+                        if item["id"] in stub.data[collection]:
+                            return self.reply(409, {"error": "data exists"})
+                        stub.data[collection][item["id"]] = item
+                self.reply(200)
+
+            def do_PATCH(self):
+                collection, key, _ = self.target()
+                with stub.lock:
+                    if collection is None or key not in stub.data[collection]:
+                        return self.reply(404, {"error": "not found"})
+                    changes = {k: v for k, v in self.body().items() if v is not None}
+                    stub.data[collection][key].update(changes)
+                self.reply(200)
+
+            def do_DELETE(self):
+                collection, key, _ = self.target()
+                with stub.lock:
+                    if collection is None or key not in stub.data[collection]:
+                        return self.reply(404, {"error": "not found"})
+                    del stub.data[collection][key]
+                self.reply(200)
+
+        return Handler
+
+
+class GitlabStub:
+    """
+    This class is a local stand-in for the GitLab API covering the calls made by the Git class:
+    project lookup, repository files, branches and merge requests.
+    """
+
+    def __init__(self, services=ServiceDbStub) -> None:
+        self.lock = threading.Lock()
+        self.merge_requests = {}
+        self.files = {
+            SITE_SERVICE: json.dumps(
+                {"site-service:sites": list(services.data["sites"].values())}, indent=4
+            ),
+            VPN_SERVICE: json.dumps(
+                {"vpn-service:vpns": list(services.data["vpns"].values())}, indent=4
+            ),
+        }
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body=None, headers=None):
+                content = json.dumps(body).encode("utf-8") if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(content)
+
+            def body(self):
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def file(self):
+                path = urlparse(self.path).path.split("/repository/files/")[-1]
+                file_path = unquote(path)
+                content = stub.files[file_path].encode("utf-8")
+                return {
+                    "file_path": file_path,
+                    "file_name": os.path.basename(file_path),
+                    "ref": "main",
+                    "encoding": "base64",
+                    "content": base64.b64encode(content).decode("utf-8"),
+                    "content_sha256": hashlib.sha256(content).hexdigest(),
+                    "blob_id": hashlib.sha1(content).hexdigest(),
+                }
+
+            def do_HEAD(self):
+                file = self.file()
+                self.reply(
+                    200,
+                    headers={
+                        "X-Gitlab-File-Path": file["file_path"],
+                        "X-Gitlab-Blob-Id": file["blob_id"],
+                        "X-Gitlab-Content-Sha256": file["content_sha256"],
+                    },
+                )
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if "/repository/files/" in path:
+                    return self.reply(200, self.file())
+                if path.endswith("/merge_requests"):
+                    with stub.lock:
+                        return self.reply(200, list(stub.merge_requests.values()))
+                if path.endswith("/pipelines"):
+                    return self.reply(200, [])
+                self.reply(200, {"id": 1, "path_with_namespace": "loadtest/infra"})
+
+            def do_POST(self):
+                body = self.body()
+                if self.path.endswith("/repository/branches"):
+                    return self.reply(201, {"name": body["branch"]})
+                with stub.lock:
+                    iid = len(stub.merge_requests) + 1
+                    stub.merge_requests[iid] = {
+                        "id": iid,
+                        "iid": iid,
+                        "source_branch": body["source_branch"],
+                        "state": "opened",
+                    }
+                self.reply(201, stub.merge_requests[iid])
+
+            def do_PUT(self):
+                self.body()
+                path = urlparse(self.path).path.split("/repository/files/")[-1]
+                self.reply(200, {"file_path": unquote(path), "branch": "services"})
+
+        return Handler
+
+
+class LoadTest:
+    """
+    This class starts the RESTCONF and GitLab stubs and the service API on local ports and drives
+    the API with a weighted request mix from concurrent clients.
+    """
+
+    def __init__(self, sites=int) -> None:
+        self.service_db = ServiceDbStub(sites=sites)
+        self.gitlab = GitlabStub(services=self.service_db)
+        self.servers = []
+
+    def __serve(self, server):
+        self.servers.append(server)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def start(self):
+        """
+        Starts the stubs and loads the service API against them.
+
+        :return: Seconds it took to import the service API.
+        """
+
+        os.environ["SERVICE_DB_URL"] = self.__serve(
+            ThreadingHTTPServer(("127.0.0.1", 0), self.service_db.handler())
+        )
+        os.environ["GITLAB_URL"] = self.__serve(
+            ThreadingHTTPServer(("127.0.0.1", 0), self.gitlab.handler())
+        )
+        os.environ["GITLAB_TOKEN"] = "loadtest"
+        os.environ["GITLAB_PROJECT_ID"] = "1"
+        os.environ["SITE_SERVICE"] = SITE_SERVICE
+        os.environ["VPN_SERVICE"] = VPN_SERVICE
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        start = time.perf_counter()
+        spec = importlib.util.spec_from_file_location(
+            "svc_api", os.path.join(os.path.dirname(__file__), "svc-api.py")
+        )
+        self.svc_api = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.svc_api)
+        startup = time.perf_counter() - start
+
+        self.url = self.__serve(
+            make_server("127.0.0.1", 0, self.svc_api.app, threaded=True)
+        )
+        return startup
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+
+    def __request(self, session, operation):
+        with self.service_db.lock:
+            site_id = random.choice(list(self.service_db.data["sites"]) or [1])
+        vpn_id = random.randint(100, 110)
+        new_site = random.randint(200, 254)
+        requests_by_operation = {
+            "list_sites": ("GET /site/", "GET", "/site/", None),
+            "list_vpns": ("GET /vpn/", "GET", "/vpn/", None),
+            "get_site": ("GET /site/<id>", "GET", f"/site/{site_id}", None),
+            "get_vpn": ("GET /vpn/<id>", "GET", f"/vpn/{vpn_id}", None),
+            "post_site": (
+                "POST /site/",
+                "POST",
+                "/site/",
+                {
+                    "id": new_site,
+                    "name": f"site-{new_site}",
+                    "type": "Branch",
+                    "router": [f"C8K-{new_site:08X}"],
+                    "switches": [f"BRK2357S{new_site}S"],
+                },
+            ),
+            "patch_site": (
+                "PATCH /site/<id>",
+                "PATCH",
+                f"/site/{site_id}",
+                {"name": f"site-{site_id:02d}-{random.randint(0, 9)}"},
+            ),
+            "patch_vpn": (
+                "PATCH /vpn/<id>",
+                "PATCH",
+                f"/vpn/{vpn_id}",
+                {"name": f"VPN{vpn_id}-{random.randint(0, 9)}"},
+            ),
+            "delete_site": ("DELETE /site/<id>", "DELETE", f"/site/{new_site}", None),
+            "infra_diff": ("GET /infra/diff", "GET", "/infra/diff", None),
+            "infra_commit": ("POST /infra/commit", "POST", "/infra/commit", None),
+        }
+        endpoint, method, path, payload = requests_by_operation[operation]
+
+        start = time.perf_counter()
+        try:
+            response = session.request(method, f"{self.url}{path}", json=payload)
+            status = response.status_code
+            size = int(response.headers.get("Content-Length", 0))
+        except requests.RequestException:
+            status = None
+            size = 0
+        return endpoint, status, time.perf_counter() - start, size
+
+    def __client(self, mix, deadline, encoding, results):
+        session = requests.Session()
+        session.headers["Accept-Encoding"] = encoding
+        operations = list(mix)
+        weights = list(mix.values())
+        while time.perf_counter() < deadline:
+            operation = random.choices(operations, weights)[0]
+            results.append(self.__request(session, operation))
+
+    def run(self, mix=str, concurrency=int, duration=float, encoding="gzip"):
+        """
+        Drives the service API with a request mix.
+
+        :param mix: Name of the request mix.
+        :param concurrency: Number of concurrent clients.
+        :param duration: Duration of the run in seconds.
+        :param encoding: Accept-Encoding sent by the clients.
+        :return: Throughput, latency percentiles and response size per endpoint.
+        """
+
+        results = []
+        start = time.perf_counter()
+        deadline = start + duration
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(self.__client, MIXES[mix], deadline, encoding, results)
+        elapsed = time.perf_counter() - start
+
+        endpoints = {}
+        for endpoint, status, latency, size in results:
+            endpoints.setdefault(endpoint, {"latencies": [], "status": {}, "bytes": 0})
+            endpoints[endpoint]["latencies"].append(latency)
+            endpoints[endpoint]["bytes"] += size
+            status = str(status)
+            endpoints[endpoint]["status"][status] = (
+                endpoints[endpoint]["status"].get(status, 0) + 1
+            )
+
+        return {
+            "mix": mix,
+            "concurrency": concurrency,
+            "encoding": encoding,
+            "duration": round(elapsed, 3),
+            "requests": len(results),
+            "throughput": round(len(results) / elapsed, 2),
+            "endpoints": {
+                endpoint: {
+                    "requests": len(stats["latencies"]),
+                    "throughput": round(len(stats["latencies"]) / elapsed, 2),
+                    "status": stats["status"],
+                    "bytes": stats["bytes"] // len(stats["latencies"]),
+                    **percentiles(stats["latencies"]),
+                }
+                for endpoint, stats in sorted(endpoints.items())
+            },
+        }
+
+
+def percentiles(latencies=list):
+    """
+    Calculates latency percentiles in milliseconds.
+
+    :param latencies: Latencies in seconds.
+    :return: p50, p95 and p99 latency.
+    """
+
+    latencies = sorted(latencies)
+    return {
+        f"p{p}": round(latencies[len(latencies) * p // 100] * 1000, 2)
+        for p in (50, 95, 99)
+    }
+
+
+@click.command()
+@click.option(
+    "--mix", type=click.Choice(list(MIXES)), default="read-heavy", help="Request mix"
+)
+@click.option("--concurrency", default=10, help="Number of concurrent clients")
+@click.option("--duration", default=10.0, help="Duration of the run in seconds")
+@click.option("--sites", default=200, help="Number of sites in the service database")
+@click.option("--encoding", default="gzip", help="Accept-Encoding sent by the clients")
+@click.option(
+    "--max-startup",
+    type=float,
+    default=None,
+    help="Fail if importing the service API takes longer (seconds)",
+)
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="File to write the JSON report to, stdout by default",
+)
+def cli(mix, concurrency, duration, sites, encoding, max_startup, output):
+    loadtest = LoadTest(sites=sites)
+    startup = loadtest.start()
+    try:
+        report = loadtest.run(
+            mix=mix, concurrency=concurrency, duration=duration, encoding=encoding
+        )
+    finally:
+        loadtest.stop()
+
+    report["startup"] = round(startup, 3)
+    output.write(json.dumps(report, indent=4) + "\n")
+
+    if max_startup is not None and startup > max_startup:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    cli()
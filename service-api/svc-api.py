@@ -15,15 +15,72 @@ IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 """
 
-from flask import Flask
-from flask_restx import Resource, Api, reqparse
+from flask import Flask, Response, g, make_response, request, stream_with_context
+from flask_restx import Resource, Api, inputs, reqparse
+from yangson import DataModel
+from yangson.exceptions import YangsonException
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    CONTENT_TYPE_LATEST,
+    generate_latest,
+    multiprocess,
+)
 import requests
 import json
 import gitlab
 import datetime
 import base64
+import hashlib
+import hmac
+import threading
+import queue
+import gzip
+import time
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+
+
+def dumps(data, sort_keys=False):
+    """
+    Serialises data to compact JSON, using orjson if it is installed.
+
+    :param data: The data to serialise.
+    :param sort_keys: Sort dictionary keys, e.g. for hashing.
+    :return: The JSON document as bytes.
+    """
+
+    if orjson:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(data, sort_keys=sort_keys, separators=(",", ":")).encode("utf-8")
+
+
+def loads(content):
+    """
+    Parses a JSON document, using orjson if it is installed.
+
+    :param content: The JSON document as bytes or string.
+    :return: The parsed data.
+    """
+
+    if orjson:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
 app = Flask(__name__)
 api = Api(
     app,
@@ -32,12 +89,159 @@ api = Api(
     description="Service API for managing EN Infrastructure in BRKOPS-2357",
 )
 
+
+@api.representation("application/json")
+def output_json(data, code, headers=None):
+    response = make_response(dumps(data), code)
+    response.headers.extend(headers or {})
+    response.mimetype = "application/json"
+    return response
+
+
 sites = api.namespace("site", description="site management")
 
 vpns = api.namespace("vpn", description="vpn management")
 
 infra = api.namespace("infra", description="infrastructure")
 
+request_count = Counter(
+    "svc_api_requests_total",
+    "Requests handled by the service API",
+    ["namespace", "method", "status"],
+)
+request_latency = Histogram(
+    "svc_api_request_duration_seconds",
+    "Request latency of the service API",
+    ["namespace", "method"],
+)
+requests_in_flight = Gauge(
+    "svc_api_requests_in_flight",
+    "Requests currently handled by the service API",
+    ["namespace"],
+    multiprocess_mode="livesum",
+)
+upstream_latency = Histogram(
+    "svc_api_upstream_duration_seconds",
+    "Latency of requests to upstream services",
+    ["upstream", "method"],
+)
+validation_latency = Histogram(
+    "svc_api_validation_duration_seconds",
+    "Latency of YANG validation of request bodies",
+    ["service", "result"],
+)
+cache_lookups = Counter(
+    "svc_api_cache_lookups_total",
+    "Cache lookups of the service API",
+    ["cache", "result"],
+)
+
+
+def observe_upstream(upstream):
+    """
+    Creates a requests response hook recording the latency of an upstream service.
+
+    :param upstream: Name of the upstream service.
+    :return: The response hook.
+    """
+
+    def hook(response, *args, **kwargs):
+        upstream_latency.labels(upstream, response.request.method).observe(
+            response.elapsed.total_seconds()
+        )
+
+    return hook
+
+
+def upstream_session(upstream):
+    session = requests.Session()
+    session.hooks["response"].append(observe_upstream(upstream))
+    return session
+
+
+def request_namespace():
+    if request.url_rule is None:
+        return "none"
+    return request.url_rule.rule.strip("/").split("/")[0] or "root"
+
+
+@app.before_request
+def start_request():
+    if request.path == "/metrics":
+        return
+    g.namespace = request_namespace()
+    g.start = time.perf_counter()
+    requests_in_flight.labels(g.namespace).inc()
+
+
+@app.after_request
+def record_request(response):
+    if "start" in g:
+        request_latency.labels(g.namespace, request.method).observe(
+            time.perf_counter() - g.start
+        )
+        request_count.labels(g.namespace, request.method, response.status_code).inc()
+    return response
+
+
+@app.teardown_request
+def end_request(exception):
+    if "start" in g:
+        requests_in_flight.labels(g.namespace).dec()
+
+
+@app.after_request
+def compress(response):
+    """
+    Compresses responses larger than COMPRESS_MIN_SIZE with brotli or gzip, whichever the client
+    prefers. ETags are made weak whenever a compressed representation could be served.
+    """
+
+    encodings = ["br", "gzip"] if brotli else ["gzip"]
+    encoding = request.accept_encodings.best_match(encodings)
+    if (
+        encoding is None
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+    if response.status_code != 200 or response.content_length < COMPRESS_MIN_SIZE:
+        return response
+    data = response.get_data()
+    if encoding == "br":
+        response.set_data(brotli.compress(data, quality=4))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def if_none_match():
+    """
+    Returns the ETags of the client's cached copies. As required for If-None-Match they are compared
+    weakly, so copies received with a compressed, weak ETag still match.
+    """
+
+    if request.if_none_match.star_tag:
+        return request.if_none_match
+    return request.if_none_match.as_set(include_weak=True)
+
+
+@app.route("/metrics")
+def metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
 
 class ServiceDb:
     """
@@ -47,22 +251,127 @@ class ServiceDb:
     def __init__(self) -> None:
         service_db_url = os.getenv("SERVICE_DB_URL")
         self.url = f"{service_db_url}/restconf/data"
+        self.session = upstream_session("restconf")
+
+    def __get(self, path, params=None):
+        """
+        Retrieves data and pushes the query parameters down to RESTCONF. Falls back to
+        a plain request if the service database rejects the query parameters.
+
+        :param path: RESTCONF path of the data.
+        :param params: RESTCONF query parameters.
+        :return: The RESTCONF response.
+        """
+
+        if params:
+            response = self.session.get(f"{self.url}/{path}", params=params)
+            if response.status_code == 200:
+                return response
+        return self.session.get(f"{self.url}/{path}")
+
+    def __etag(self, content, *variant):
+        """
+        Calculates a strong ETag from the RESTCONF payload and the parameters shaping the response.
+
+        :param content: The raw RESTCONF payload.
+        :param variant: Parameters the response body depends on.
+        :return: The ETag without quotes.
+        """
+
+        digest = hashlib.sha256(content)
+        digest.update(repr(variant).encode("utf-8"))
+        return digest.hexdigest()
+
+    def __select(self, items, filters, fields, limit, offset):
+        """
+        Applies filters, pagination and field projection to list entries.
+
+        :param items: The list entries.
+        :param filters: Leaf name to value; leaf-lists match if they contain the value.
+        :param fields: Leaves to keep per entry, all if omitted.
+        :param limit: Maximum number of entries to return.
+        :param offset: Number of entries to skip.
+        :return: The selected entries and the number of entries matching the filters.
+        """
+
+        for leaf, value in filters.items():
+            if value is None:
+                continue
+            items = [
+                item
+                for item in items
+                if (
+                    value in item.get(leaf, [])
+                    if isinstance(item.get(leaf), list)
+                    else item.get(leaf) == value
+                )
+            ]
+        total = len(items)
+        items = items[offset : offset + limit if limit is not None else None]
+        if fields:
+            items = [{k: v for k, v in item.items() if k in fields} for item in items]
+        return items, total
+
+    def __query(self, path, key, filters, fields, limit, offset, if_none_match):
+        params = None
+        if fields:
+            filtered = {leaf for leaf, value in filters.items() if value is not None}
+            params = {"fields": ";".join(sorted(set(fields) | filtered | {"id"}))}
+        response = self.__get(path, params=params)
+        if response.status_code != 200:
+            return {"error": response.content.decode("utf-8")}, None, None
+
+        etag = self.__etag(response.content, filters, fields, limit, offset)
+        if etag in if_none_match:
+            return None, None, etag
+
+        data = loads(response.content)
+        items, total = self.__select(data.get(key, []), filters, fields, limit, offset)
+        return {key: items}, total, etag
+
+    def get_vpn_list(
+        self, name=None, sites=None, fields=None, limit=None, offset=0, if_none_match=()
+    ):
+        """
+        Lists VPNs with optional filtering, pagination and field projection.
+
+        :param name: Only VPNs with this name.
+        :param sites: Only VPNs deployed to this site type.
+        :param fields: Leaves to return per VPN.
+        :param limit: Maximum number of VPNs to return.
+        :param offset: Number of VPNs to skip.
+        :param if_none_match: ETags the client already has.
+        :return: The VPNs (None if not modified), the number of VPNs matching the filters and the ETag.
+        """
+
+        return self.__query(
+            "vpn-service:vpns",
+            "vpns",
+            {"name": name, "sites": sites},
+            fields,
+            limit,
+            offset,
+            if_none_match,
+        )
 
     def get_vpn_all(self):
-        response = requests.get(f"{self.url}/vpn-service:vpns")
+        response = self.session.get(f"{self.url}/vpn-service:vpns")
         if response.status_code != 200:
             return {"error": response.content.decode("utf-8")}
-        return response.json()
+        return loads(response.content)
 
-    def get_vpn_by_id(self, id=str):
-        response = requests.get(f"{self.url}/vpn-service:vpns={id}")
+    def get_vpn_by_id(self, id=str, if_none_match=()):
+        response = self.session.get(f"{self.url}/vpn-service:vpns={id}")
         if response.status_code != 200:
-            return {"error": response.content.decode("utf-8")}
-        return response.json()
+            return {"error": response.content.decode("utf-8")}, None
+        etag = self.__etag(response.content)
+        if etag in if_none_match:
+            return None, etag
+        return loads(response.content), etag
 
     def post_vpn(self, id=int, name=str, sites=list):
         payload = {"vpns": [{"id": id, "name": name, "sites": sites}]}
-        response = requests.post(
+        response = self.session.post(
             f"{self.url}/vpn-service:vpns", data=json.dumps(payload)
         )
         if response.status_code != 200:
@@ -71,31 +380,58 @@ class ServiceDb:
 
     def patch_vpn(self, id=int, name=str, sites=list):
         payload = {"name": name, "sites": sites}
-        response = requests.patch(
+        response = self.session.patch(
             f"{self.url}/vpn-service:vpns={id}", data=json.dumps(payload)
         )
-        print(response)
         if response.status_code != 200:
             return {"error": response.content.decode("utf-8")}
         return response.status_code
 
     def delete_vpn(self, id=int):
-        response = requests.delete(f"{self.url}/vpn-service:vpns={id}")
+        response = self.session.delete(f"{self.url}/vpn-service:vpns={id}")
         if response.status_code != 200:
             return {"error": response.content.decode("utf-8")}
         return response.status_code
 
     def get_site_all(self):
-        response = requests.get(f"{self.url}/site-service:sites")
+        response = self.session.get(f"{self.url}/site-service:sites")
         if response.status_code != 200:
             return {"error": response.content.decode("utf-8")}
-        return response.json()
+        return loads(response.content)
+
+    def get_site_list(
+        self, name=None, type=None, fields=None, limit=None, offset=0, if_none_match=()
+    ):
+        """
+        Lists sites with optional filtering, pagination and field projection.
+
+        :param name: Only sites with this name.
+        :param type: Only sites of this type.
+        :param fields: Leaves to return per site.
+        :param limit: Maximum number of sites to return.
+        :param offset: Number of sites to skip.
+        :param if_none_match: ETags the client already has.
+        :return: The sites (None if not modified), the number of sites matching the filters and the ETag.
+        """
+
+        return self.__query(
+            "site-service:sites",
+            "sites",
+            {"name": name, "type": type},
+            fields,
+            limit,
+            offset,
+            if_none_match,
+        )
 
-    def get_site_by_id(self, id):
-        response = requests.get(f"{self.url}/site-service:sites={id}")
+    def get_site_by_id(self, id, if_none_match=()):
+        response = self.session.get(f"{self.url}/site-service:sites={id}")
         if response.status_code != 200:
-            return {"error": response.content.decode("utf-8")}
-        return response.json()
+            return {"error": response.content.decode("utf-8")}, None
+        etag = self.__etag(response.content)
+        if etag in if_none_match:
+            return None, etag
+        return loads(response.content), etag
 
     def post_site(self, id=int, name=str, type=str, router=list, switches=list):
         payload = {
@@ -109,7 +445,7 @@ class ServiceDb:
                 }
             ]
         }
-        response = requests.post(
+        response = self.session.post(
             f"{self.url}/site-service:sites", data=json.dumps(payload)
         )
         if response.status_code != 200:
@@ -118,7 +454,7 @@ class ServiceDb:
 
     def patch_site(self, id=int, name=str, type=str, router=list, switches=list):
         payload = {"name": name, "type": type, "router": router, "switches": switches}
-        response = requests.patch(
+        response = self.session.patch(
             f"{self.url}/site-service:sites={id}", data=json.dumps(payload)
         )
         if response.status_code != 200:
@@ -126,7 +462,7 @@ class ServiceDb:
         return response.status_code
 
     def delete_site(self, id=int):
-        response = requests.delete(f"{self.url}/site-service:sites={id}")
+        response = self.session.delete(f"{self.url}/site-service:sites={id}")
         if response.status_code != 200:
             return {"error": response.content.decode("utf-8")}
         return response.status_code
@@ -141,8 +477,67 @@ class Git:
         self.private_token = os.getenv("GITLAB_TOKEN")
         self.url = os.getenv("GITLAB_URL")
         self.project_id = os.getenv("GITLAB_PROJECT_ID")
-        self.gl = gitlab.Gitlab(self.url, private_token=self.private_token)
-        self.project = self.gl.projects.get(self.project_id)
+        self.main_digests = {}
+        self.__project = None
+        self.__lock = threading.Lock()
+
+    @property
+    def project(self):
+        """
+        The GitLab project, authenticated and fetched on first use and cached afterwards.
+        """
+
+        if self.__project is None:
+            with self.__lock:
+                if self.__project is None:
+                    gl = gitlab.Gitlab(
+                        self.url,
+                        private_token=self.private_token,
+                        session=upstream_session("gitlab"),
+                    )
+                    self.__project = gl.projects.get(self.project_id)
+        return self.__project
+
+    def __digest(self, data):
+        """
+        Calculates a canonical hash of service data, independent of key order and formatting.
+
+        :param data: The service data as dictionary.
+        :return: The sha256 hex digest.
+        """
+
+        return hashlib.sha256(dumps(data, sort_keys=True)).hexdigest()
+
+    def __main_digest(self, file_path):
+        """
+        Returns the canonical hash of a service file on main. The file content is only fetched
+        when the blob SHA reported by GitLab differs from the cached one.
+
+        :param file_path: Path of the service file in the repository.
+        :return: The sha256 hex digest of the file content.
+        """
+
+        headers = self.project.files.head(file_path=file_path, ref="main")
+        blob_sha = headers["X-Gitlab-Content-Sha256"]
+
+        cached = self.main_digests.get(file_path)
+        if cached and cached["blob_sha"] == blob_sha:
+            cache_lookups.labels("main_digest", "hit").inc()
+            return cached["digest"]
+        cache_lookups.labels("main_digest", "miss").inc()
+
+        file = self.project.files.get(file_path=file_path, ref="main")
+        content = loads(base64.b64decode(file.content))
+        digest = self.__digest(content)
+        self.main_digests[file_path] = {"blob_sha": blob_sha, "digest": digest}
+        return digest
+
+    def __export_services(self):
+        site_service = services.get_site_all()
+        site_service["site-service:sites"] = site_service.pop("sites")
+        vpn_service = services.get_vpn_all()
+        vpn_service["vpn-service:vpns"] = vpn_service.pop("vpns")
+        return site_service, vpn_service
 
     def __create_branch(self):
         now = datetime.datetime.now()
@@ -202,28 +597,363 @@ class Git:
 
         return self.merge_request.state
 
+    def diff(self, site_service=None, vpn_service=None):
+        """
+        Compares the service database with the service files on main without creating a branch.
+
+        :param site_service: Already exported site service data, exported from the service database if omitted.
+        :param vpn_service: Already exported vpn service data, exported from the service database if omitted.
+        :return: Per service file, whether it differs from main.
+        """
+
+        if site_service is None or vpn_service is None:
+            site_service, vpn_service = self.__export_services()
+
+        return {
+            "site_service": {
+                "changed": self.__digest(site_service)
+                != self.__main_digest(os.getenv("SITE_SERVICE"))
+            },
+            "vpn_service": {
+                "changed": self.__digest(vpn_service)
+                != self.__main_digest(os.getenv("VPN_SERVICE"))
+            },
+        }
+
     def push_to_infra(self):
         """
         Pushes the site and VPN service data to the infrastructure repository in GitLab.
+        No branch or merge request is created if the service data already matches main.
 
         :return: The state of the created merge request.
         """
-        site_service = services.get_site_all()
-        site_service["site-service:sites"] = site_service.pop("sites")
+        site_service, vpn_service = self.__export_services()
+
+        diff = self.diff(site_service=site_service, vpn_service=vpn_service)
+        if not any(service["changed"] for service in diff.values()):
+            return {"merge_request_state": None, "diff": diff}
+
         site_service_json = json.dumps(site_service, indent=4)
-        vpn_service = services.get_vpn_all()
-        vpn_service["vpn-service:vpns"] = vpn_service.pop("vpns")
         vpn_service_json = json.dumps(vpn_service, indent=4)
 
         self.__create_branch()
         self.__commit_to_branch(
             site_service_data=site_service_json, vpn_service_data=vpn_service_json
         )
-        return {"merge_request_state": self.__create_merge_request()}
+        merge_request_state = self.__create_merge_request()
+        events.publish(
+            "merge_request",
+            {
+                "iid": self.merge_request.iid,
+                "source_branch": self.new_branch.name,
+                "state": merge_request_state,
+            },
+        )
+        return {"merge_request_state": merge_request_state, "diff": diff}
+
+
+FINISHED_STATES = {
+    "merge_request": ("merged", "closed"),
+    "pipeline": ("success", "failed", "canceled", "skipped"),
+}
+
+
+class Events:
+    """
+    This class fans out merge request and pipeline state changes of service-api branches to any number
+    of Server-Sent Events subscribers. A single poller per process queries GitLab while subscribers are
+    connected; GitLab webhooks received by the API are published through the same path.
+    """
+
+    def __init__(self) -> None:
+        self.interval = int(os.getenv("EVENTS_POLL_INTERVAL", 10))
+        self.webhook_token = os.getenv("GITLAB_WEBHOOK_TOKEN")
+        self.subscribers = set()
+        self.states = {}
+        self.finished = {}
+        self.finished_ttl = max(60, 3 * self.interval)
+        self.lock = threading.Lock()
+        self.poller = None
+
+    def publish(self, event, data):
+        """
+        Sends an event to all subscribers if the state of the merge request or pipeline changed.
+
+        :param event: Either "merge_request" or "pipeline".
+        :param data: The event data, identified by its iid or id.
+        """
+
+        key = (event, data.get("iid", data.get("id")))
+        state = data.get("state", data.get("status"))
+        now = time.monotonic()
+        with self.lock:
+            self.finished = {
+                finished_key: finished
+                for finished_key, finished in self.finished.items()
+                if now - finished < self.finished_ttl
+            }
+            if self.states.get(key) == state or key in self.finished:
+                return
+            if state in FINISHED_STATES[event]:
+                # Finished merge requests and pipelines no longer change, only remember them long
+                # enough to drop repeats from overlapping polls and webhooks
+                self.states.pop(key, None)
+                self.finished[key] = now
+            else:
+                self.states[key] = state
+            subscribers = list(self.subscribers)
+        message = f"event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+        for subscriber in subscribers:
+            subscriber.put(message)
+
+    def __tracked(self, ref):
+        return (
+            ref == "main"
+            or ref.startswith("services_")
+            or ref.startswith("refs/merge-requests/")
+        )
+
+    def __poll(self):
+        since = datetime.datetime.now(datetime.timezone.utc)
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.poller = None
+                    return
+            start = datetime.datetime.now(datetime.timezone.utc)
+            updated_after = (
+                since - datetime.timedelta(seconds=self.interval)
+            ).isoformat()
+            try:
+                for mr in git.project.mergerequests.list(
+                    updated_after=updated_after, iterator=True
+                ):
+                    if mr.source_branch.startswith("services_"):
+                        self.publish(
+                            "merge_request",
+                            {
+                                "iid": mr.iid,
+                                "source_branch": mr.source_branch,
+                                "state": mr.state,
+                            },
+                        )
+                for pipeline in git.project.pipelines.list(
+                    updated_after=updated_after, iterator=True
+                ):
+                    if self.__tracked(pipeline.ref):
+                        self.publish(
+                            "pipeline",
+                            {
+                                "id": pipeline.id,
+                                "ref": pipeline.ref,
+                                "status": pipeline.status,
+                                "web_url": pipeline.web_url,
+                            },
+                        )
+                since = start
+            except Exception as e:
+                app.logger.warning(f"Polling GitLab events failed: {e}")
+            time.sleep(self.interval)
+
+    def webhook(self, event, payload):
+        """
+        Publishes a GitLab merge request or pipeline webhook.
+
+        :param event: Value of the X-Gitlab-Event header.
+        :param payload: The webhook payload.
+        :return: None, or an error if the payload misses required attributes.
+        """
+
+        attributes = (
+            payload.get("object_attributes") if isinstance(payload, dict) else None
+        )
+        if not isinstance(attributes, dict):
+            return {"error": "object_attributes missing from webhook payload"}
+        required = {
+            "Merge Request Hook": ("iid", "source_branch", "state"),
+            "Pipeline Hook": ("id", "ref", "status"),
+        }.get(event, ())
+        missing = [name for name in required if attributes.get(name) is None]
+        if missing:
+            return {"error": f"Webhook attributes missing: {', '.join(missing)}"}
+
+        if event == "Merge Request Hook" and attributes.get(
+            "source_branch", ""
+        ).startswith("services_"):
+            self.publish(
+                "merge_request",
+                {
+                    "iid": attributes["iid"],
+                    "source_branch": attributes["source_branch"],
+                    "state": attributes["state"],
+                },
+            )
+        elif event == "Pipeline Hook" and self.__tracked(attributes.get("ref", "")):
+            self.publish(
+                "pipeline",
+                {
+                    "id": attributes["id"],
+                    "ref": attributes["ref"],
+                    "status": attributes["status"],
+                    "web_url": attributes.get("url"),
+                },
+            )
+
+    def subscribe(self):
+        """
+        Streams events to one subscriber until it disconnects. Sends a comment every 15 seconds
+        to keep the connection open.
+
+        :return: Generator of Server-Sent Events messages.
+        """
+
+        subscriber = queue.Queue()
+        with self.lock:
+            self.subscribers.add(subscriber)
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.__poll, daemon=True)
+                self.poller.start()
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    yield subscriber.get(timeout=15)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self.lock:
+                self.subscribers.discard(subscriber)
+
+
+class Validator:
+    """
+    This class validates service data against the site-service and vpn-service YANG modules before it is
+    written to the service database. The data model is compiled once and shared across requests.
+    """
+
+    def __init__(self) -> None:
+        base_dir = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "..", "yang"
+        )
+        library = os.getenv(
+            "YANG_LIBRARY",
+            os.path.join(base_dir, "library", "yang-library-services.json"),
+        )
+        modules = os.getenv("YANG_MODULES", os.path.join(base_dir, "modules"))
+        self.dm = DataModel.from_file(library, [modules])
+
+    def validate_change(self, service, id, changes, existing=False):
+        """
+        Validates a site or VPN as it would be after creating or updating it. A site is validated
+        on its own, a VPN together with the sites its leafref to the site types points at. Key
+        uniqueness and the whole data set are still validated by loader.py in the pipeline.
+
+        :param service: Either "site" or "vpn".
+        :param id: ID of the site or VPN.
+        :param changes: Leaves to set, None values are left unchanged.
+        :param existing: Merge the changes into the site or VPN in the service database.
+        :return: None if the data is valid, an error otherwise.
+        """
+
+        entry = {"id": id}
+        if existing:
+            if service == "site":
+                current, _ = services.get_site_by_id(id)
+            else:
+                current, _ = services.get_vpn_by_id(id)
+            if "error" in current:
+                return current
+            entry.update(current[f"{service}s"][0])
+        entry.update({k: v for k, v in changes.items() if v is not None})
+
+        if service == "site":
+            raw = {"site-service:sites": [entry]}
+        else:
+            sites = services.get_site_all()
+            if "error" in sites:
+                return sites
+            raw = {
+                "site-service:sites": sites.get("sites", []),
+                "vpn-service:vpns": [entry],
+            }
+
+        start = time.perf_counter()
+        try:
+            self.dm.from_raw(raw).validate()
+        except YangsonException as e:
+            validation_latency.labels(service, "invalid").observe(
+                time.perf_counter() - start
+            )
+            return {"error": f"Data validation: failed. {e}"}
+        validation_latency.labels(service, "valid").observe(time.perf_counter() - start)
 
 
 services = ServiceDb()
 git = Git()
+events = Events()
+validator = Validator()
+
+
+def conditional(data, etag, headers=None):
+    """
+    Builds the response for a conditional GET.
+
+    :param data: The response body, None if the client's copy is still current.
+    :param etag: The ETag of the resource, None on errors.
+    :param headers: Additional headers for a full response.
+    :return: The response tuple for flask-restx.
+    """
+
+    if etag is None:
+        return data
+    if request.if_none_match:
+        cache_lookups.labels("etag", "miss" if data is not None else "hit").inc()
+    if data is None:
+        return None, 304, {"ETag": f'"{etag}"'}
+    return data, 200, {**(headers or {}), "ETag": f'"{etag}"'}
+
+
+VPN_LEAVES = ("id", "name", "sites")
+SITE_LEAVES = ("id", "name", "type", "router", "switches")
+
+
+def check_fields(fields, leaves):
+    unknown = sorted(set(fields or ()) - set(leaves))
+    if unknown:
+        return {"error": f"Unknown fields: {', '.join(unknown)}"}
+
+
+vpn_list_parser = reqparse.RequestParser()
+vpn_list_parser.add_argument(
+    "name", type=str, required=False, location="args", help="VPN Name"
+)
+vpn_list_parser.add_argument(
+    "sites",
+    type=str,
+    required=False,
+    choices=("DC", "Branch"),
+    location="args",
+    help="DC or Branch",
+)
+vpn_list_parser.add_argument(
+    "fields",
+    type=str,
+    required=False,
+    action="split",
+    location="args",
+    help="Comma separated leaves to return: id, name, sites",
+)
+vpn_list_parser.add_argument(
+    "limit", type=inputs.positive, required=False, location="args", help="Page size"
+)
+vpn_list_parser.add_argument(
+    "offset",
+    type=inputs.natural,
+    required=False,
+    default=0,
+    location="args",
+    help="Page start",
+)
 
 vpn_post_parser = reqparse.RequestParser()
 vpn_post_parser.add_argument("id", type=int, required=True, help="VPN ID")
@@ -248,6 +978,38 @@ vpn_patch_parser.add_argument(
     help="DC and/or Branch",
 )
 
+site_list_parser = reqparse.RequestParser()
+site_list_parser.add_argument(
+    "name", type=str, required=False, location="args", help="Site Name"
+)
+site_list_parser.add_argument(
+    "type",
+    type=str,
+    required=False,
+    choices=("DC", "Branch"),
+    location="args",
+    help="DC or Branch",
+)
+site_list_parser.add_argument(
+    "fields",
+    type=str,
+    required=False,
+    action="split",
+    location="args",
+    help="Comma separated leaves to return: id, name, type, router, switches",
+)
+site_list_parser.add_argument(
+    "limit", type=inputs.positive, required=False, location="args", help="Page size"
+)
+site_list_parser.add_argument(
+    "offset",
+    type=inputs.natural,
+    required=False,
+    default=0,
+    location="args",
+    help="Page start",
+)
+
 site_post_parser = reqparse.RequestParser()
 site_post_parser.add_argument("id", type=int, required=True, help="Site ID")
 site_post_parser.add_argument("name", type=str, required=True, help="Site Name")
@@ -277,12 +1039,28 @@ site_patch_parser.add_argument(
 @vpns.route("/")
 class AllVpns(Resource):
 
+    @api.expect(vpn_list_parser)
     def get(self):
-        return services.get_vpn_all()
+        args = vpn_list_parser.parse_args()
+        error = check_fields(args.fields, VPN_LEAVES)
+        if error:
+            return error, 400
+        vpns, total, etag = services.get_vpn_list(
+            name=args.name,
+            sites=args.sites,
+            fields=args.fields,
+            limit=args.limit,
+            offset=args.offset,
+            if_none_match=if_none_match(),
+        )
+        return conditional(vpns, etag, {"X-Total-Count": str(total)})
 
     @api.expect(vpn_post_parser)
     def post(self):
         args = vpn_post_parser.parse_args()
+        error = validator.validate_change("vpn", args.id, args)
+        if error:
+            return error, 400
         return services.post_vpn(id=args.id, name=args.name, sites=args.sites)
 
 
@@ -290,11 +1068,15 @@ class AllVpns(Resource):
 class VpnId(Resource):
 
     def get(self, id):
-        return services.get_vpn_by_id(id)
+        vpn, etag = services.get_vpn_by_id(id, if_none_match=if_none_match())
+        return conditional(vpn, etag)
 
     @api.expect(vpn_patch_parser)
     def patch(self, id):
         args = vpn_patch_parser.parse_args()
+        error = validator.validate_change("vpn", id, args, existing=True)
+        if error:
+            return error, 400
         return services.patch_vpn(id=id, name=args.name, sites=args.sites)
 
     def delete(self, id):
@@ -304,12 +1086,28 @@ class VpnId(Resource):
 @sites.route("/")
 class AllSites(Resource):
 
+    @api.expect(site_list_parser)
     def get(self):
-        return services.get_site_all()
+        args = site_list_parser.parse_args()
+        error = check_fields(args.fields, SITE_LEAVES)
+        if error:
+            return error, 400
+        sites, total, etag = services.get_site_list(
+            name=args.name,
+            type=args.type,
+            fields=args.fields,
+            limit=args.limit,
+            offset=args.offset,
+            if_none_match=if_none_match(),
+        )
+        return conditional(sites, etag, {"X-Total-Count": str(total)})
 
     @api.expect(site_post_parser)
     def post(self):
         args = site_post_parser.parse_args()
+        error = validator.validate_change("site", args.id, args)
+        if error:
+            return error, 400
         return services.post_site(
             id=args.id,
             name=args.name,
@@ -323,11 +1121,15 @@ class AllSites(Resource):
 class SiteId(Resource):
 
     def get(self, id):
-        return services.get_site_by_id(id)
+        site, etag = services.get_site_by_id(id, if_none_match=if_none_match())
+        return conditional(site, etag)
 
     @api.expect(site_patch_parser)
     def patch(self, id):
         args = site_patch_parser.parse_args()
+        error = validator.validate_change("site", id, args, existing=True)
+        if error:
+            return error, 400
         return services.patch_site(
             id=id,
             name=args.name,
@@ -347,5 +1149,39 @@ class Commit(Resource):
         return git.push_to_infra()
 
 
+@infra.route("/diff")
+class Diff(Resource):
+
+    def get(self):
+        return git.diff()
+
+
+@infra.route("/events")
+class EventStream(Resource):
+
+    def get(self):
+        return Response(
+            stream_with_context(events.subscribe()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    def post(self):
+        if not events.webhook_token:
+            return {
+                "error": "webhooks are disabled, GITLAB_WEBHOOK_TOKEN is not set"
+            }, 403
+        if not hmac.compare_digest(
+            request.headers.get("X-Gitlab-Token", ""), events.webhook_token
+        ):
+            return {"error": "invalid webhook token"}, 401
+        error = events.webhook(
+            request.headers.get("X-Gitlab-Event"), request.get_json(silent=True)
+        )
+        if error:
+            return error, 400
+        return {"status": "ok"}
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,356 @@
+"""
+Copyright (c) 2024 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+from genie.utils.diff import Diff
+from genie.ops.utils import get_ops
+from common import canonical, digest
+from functools import lru_cache
+import click
+import gzip
+import json
+import time
+import os
+import re
+
+BASELINE_DIR = os.getenv("PYATS_BASELINE_DIR", "/var/baseline")
+BASELINE_KEEP = int(os.getenv("PYATS_BASELINE_KEEP", 10))
+BASELINE_MAX_AGE_DAYS = float(os.getenv("PYATS_BASELINE_MAX_AGE_DAYS", 0))
+DRIFT_PROFILE = os.getenv(
+    "PYATS_DRIFT_PROFILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "drift_profile.json")
+)
+
+@lru_cache(maxsize=None)
+def drift_profile(path=DRIFT_PROFILE):
+    """
+    :return: Genie Ops attributes to monitor per feature (PYATS_DRIFT_PROFILE), empty if there is no profile.
+    """
+
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+def learn(device, feature):
+    """
+    Learns a feature from a device. If the drift profile lists attributes for the feature, only those
+    are learned, so only the parsers they need are run. Otherwise the whole Ops model is learned.
+
+    :param device: The device.
+    :param feature: The feature, e.g. vrf.
+    :return: The learned structure.
+    """
+
+    attributes = drift_profile().get(feature)
+    if not attributes:
+        return device.learn(feature).to_dict()
+    ops = get_ops(feature, device)(device=device, attributes=attributes)
+    ops.learn()
+    return ops.to_dict()
+
+def project(data, attributes):
+    """
+    Keeps only the parts of a learned structure that Genie Ops attribute paths select, e.g.
+    info[vrfs][(.*)][route_distinguisher]. Each path segment is a regular expression matched against the keys.
+
+    :param data: The learned structure.
+    :param attributes: Attribute paths, all of data is kept if empty.
+    :return: The projected structure.
+    """
+
+    def select(data, segments):
+        if not segments:
+            return data
+        if not isinstance(data, dict):
+            return None
+        selected = {}
+        for key, value in data.items():
+            if re.fullmatch(segments[0], str(key)):
+                branch = select(value, segments[1:])
+                if branch is not None:
+                    selected[key] = branch
+        return selected or None
+
+    def merge(target, source):
+        for key, value in source.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                merge(target[key], value)
+            else:
+                target[key] = value
+
+    if not attributes:
+        return data
+    projected = {}
+    for attribute in attributes:
+        segments = [attribute.split("[", 1)[0]] + re.findall(r"\[([^\]]*)\]", attribute)
+        merge(projected, select(data, segments) or {})
+    return projected
+
+class BaselineStore:
+    """
+    This class stores lifecycle baselines as gzip compressed, content-addressed snapshots under
+    objects/<digest[:2]>/<digest>.json.gz. Each device and feature has a version index under
+    index/<feature>_<device>.json listing its snapshots oldest first, so history is kept and an
+    unchanged device does not store its state twice. Versions record the drift profile attributes they
+    were learned with. Snapshots learned with different attributes, e.g. full baselines from before the
+    drift profile, are projected onto the attributes of both before they are compared.
+    """
+
+    def __init__(self, root=BASELINE_DIR, keep=BASELINE_KEEP, max_age_days=BASELINE_MAX_AGE_DAYS, profile=None):
+        """
+        :param root: Directory of the store (PYATS_BASELINE_DIR).
+        :param keep: Versions kept per device and feature, 0 keeps all (PYATS_BASELINE_KEEP).
+        :param max_age_days: Versions older than this are evicted, the latest version is always kept,
+            0 disables it (PYATS_BASELINE_MAX_AGE_DAYS).
+        :param profile: Attributes learned per feature, defaults to the drift profile.
+        """
+
+        self.root = root
+        self.keep = keep
+        self.max_age = max_age_days * 86400
+        self.profile = drift_profile() if profile is None else profile
+        self.snapshots = {}
+
+    def snapshot_path(self, snapshot_digest):
+        """
+        :return: Path of the compressed snapshot with the given digest.
+        """
+
+        return os.path.join(self.root, "objects", snapshot_digest[:2], f"{snapshot_digest}.json.gz")
+
+    def __index_path(self, feature, device):
+        return os.path.join(self.root, "index", f"{feature}_{device}.json")
+
+    def __write(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}"
+        with open(temp_path, "wb") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+    def versions(self, feature, device):
+        """
+        :return: Versions of a device feature, oldest first, e.g. [{"version": 1, "digest": "...", "created": 1700000000.0}].
+        """
+
+        try:
+            with open(self.__index_path(feature, device)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            pass
+
+        legacy_path = os.path.join(self.root, f"base-{feature}_{device}.json")
+        if not os.path.exists(legacy_path):
+            return []
+        with open(legacy_path) as file:
+            data = canonical(json.load(file))
+        versions = [{"version": 1, "digest": self.__store(data), "created": os.path.getmtime(legacy_path)}]
+        self.__write_index(feature, device, versions)
+        return versions
+
+    def latest(self, feature, device):
+        versions = self.versions(feature, device)
+        return versions[-1] if versions else None
+
+    def __store(self, data):
+        snapshot_digest = digest(data)
+        path = self.snapshot_path(snapshot_digest)
+        if not os.path.exists(path):
+            content = json.dumps(data, separators=(",", ":")).encode("utf-8")
+            self.__write(path, gzip.compress(content, compresslevel=6))
+        self.snapshots[snapshot_digest] = data
+        return snapshot_digest
+
+    def save(self, feature, device, data):
+        """
+        Stores a snapshot as a new version unless it equals the latest version, then applies the retention.
+
+        :param feature: The learned feature, e.g. vrf.
+        :param device: The device name.
+        :param data: The learned structure.
+        :return: The stored or unchanged latest version.
+        """
+
+        data = canonical(data)
+        attributes = self.profile.get(feature)
+        versions = self.versions(feature, device)
+        if versions and versions[-1]["digest"] == digest(data) and versions[-1].get("attributes") == attributes:
+            return versions[-1]
+
+        version = {
+            "version": versions[-1]["version"] + 1 if versions else 1,
+            "digest": self.__store(data),
+            "created": time.time(),
+            "attributes": attributes,
+        }
+        versions.append(version)
+        self.__write_index(feature, device, self.__retain(versions))
+        return version
+
+    def __retain(self, versions):
+        if self.keep:
+            versions = versions[-self.keep :]
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            versions = [version for version in versions[:-1] if version["created"] >= cutoff] + versions[-1:]
+        return versions
+
+    def __write_index(self, feature, device, versions):
+        self.__write(self.__index_path(feature, device), json.dumps(versions, indent=4).encode("utf-8"))
+
+    def load(self, feature, device, version=None):
+        """
+        :param version: Version number, the latest version if omitted.
+        :return: The snapshot, None if the version does not exist.
+        """
+
+        versions = self.versions(feature, device)
+        if version is not None:
+            versions = [entry for entry in versions if entry["version"] == version]
+        if not versions:
+            return None
+        return self.snapshot(versions[-1]["digest"])
+
+    def snapshot(self, snapshot_digest):
+        if snapshot_digest not in self.snapshots:
+            with gzip.open(self.snapshot_path(snapshot_digest), "rb") as file:
+                self.snapshots[snapshot_digest] = json.loads(file.read())
+        return self.snapshots[snapshot_digest]
+
+    def compare(self, feature, device, old, new):
+        """
+        Compares two stored versions without learning from the device. Versions learned with different
+        attributes are projected onto the attributes of both.
+
+        :param old: Version number of the older snapshot.
+        :param new: Version number of the newer snapshot.
+        :return: None if both versions are identical, the genie Diff otherwise.
+        """
+
+        versions = {entry["version"]: entry for entry in self.versions(feature, device)}
+        for version in (old, new):
+            if version not in versions:
+                raise KeyError(f"{feature} version {version} of {device} not found")
+        old, new = versions[old], versions[new]
+        if old.get("attributes") == new.get("attributes"):
+            if old["digest"] == new["digest"]:
+                return None
+            old, new = self.snapshot(old["digest"]), self.snapshot(new["digest"])
+        else:
+            old, new = self.__project(
+                self.snapshot(old["digest"]), old.get("attributes"), self.snapshot(new["digest"]), new.get("attributes")
+            )
+            if digest(old) == digest(new):
+                return None
+        diff = Diff(old, new)
+        diff.findDiff()
+        return diff if diff.diffs else None
+
+    def __project(self, old, old_attributes, new, new_attributes):
+        return (
+            project(project(old, old_attributes), new_attributes),
+            project(project(new, old_attributes), new_attributes),
+        )
+
+    def find_drift(self, feature, device, data):
+        """
+        Compares learned data against the latest version. The digests are compared first, the snapshot
+        is only loaded and diffed when they differ.
+
+        :param feature: The learned feature, e.g. vrf.
+        :param device: The device name.
+        :param data: The learned structure.
+        :return: None if data matches the latest version, the genie Diff otherwise.
+        """
+
+        latest = self.latest(feature, device)
+        if latest is None:
+            raise FileNotFoundError(f"No {feature} baseline for {device}")
+        data = canonical(data)
+        attributes = self.profile.get(feature)
+        if latest.get("attributes") == attributes:
+            if latest["digest"] == digest(data):
+                return None
+            baseline = self.snapshot(latest["digest"])
+        else:
+            baseline, data = self.__project(
+                self.snapshot(latest["digest"]), latest.get("attributes"), data, attributes
+            )
+            if digest(baseline) == digest(data):
+                return None
+        diff = Diff(baseline, data)
+        diff.findDiff()
+        return diff if diff.diffs else None
+
+    def prune(self):
+        """
+        Applies the retention to all indexes and deletes snapshots no version refers to anymore.
+
+        :return: Number of deleted snapshots.
+        """
+
+        referenced = set()
+        index_dir = os.path.join(self.root, "index")
+        for name in os.listdir(index_dir) if os.path.isdir(index_dir) else []:
+            path = os.path.join(index_dir, name)
+            with open(path) as file:
+                versions = json.load(file)
+            retained = self.__retain(versions)
+            if retained != versions:
+                self.__write(path, json.dumps(retained, indent=4).encode("utf-8"))
+            referenced.update(version["digest"] for version in retained)
+
+        deleted = 0
+        for directory, _, files in os.walk(os.path.join(self.root, "objects")):
+            for name in files:
+                if name.endswith(".json.gz") and name[: -len(".json.gz")] not in referenced:
+                    os.remove(os.path.join(directory, name))
+                    self.snapshots.pop(name[: -len(".json.gz")], None)
+                    deleted += 1
+        return deleted
+
+@click.group()
+@click.pass_context
+def cli(ctx):
+    ctx.obj = BaselineStore()
+
+@cli.command()
+@click.argument("feature")
+@click.argument("device")
+@click.pass_obj
+def versions(obj, feature, device):
+    for version in obj.versions(feature, device):
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(version["created"]))
+        click.echo(f"{version['version']}: {created} {version['digest']}")
+
+@cli.command()
+@click.argument("feature")
+@click.argument("device")
+@click.argument("old", type=int)
+@click.argument("new", type=int)
+@click.pass_obj
+def compare(obj, feature, device, old, new):
+    diff = obj.compare(feature, device, old, new)
+    click.echo(diff if diff is not None else "No differences")
+
+@cli.command()
+@click.pass_obj
+def prune(obj):
+    click.echo(f"Deleted {obj.prune()} snapshots")
+
+if __name__ == "__main__":
+    cli()
@@ -16,6 +16,7 @@ or implied.
 """
 
 from pyats import aetest
+from common import connect_devices, disconnect_devices, reachable
 import requests
 requests.packages.urllib3.disable_warnings()
 
@@ -23,9 +24,10 @@ class CommonSetup(aetest.CommonSetup):
     
     @aetest.subsection
     def connect(self, testbed):
-        for device in testbed:
-            if device.type == "C8000V":
-                device.connect(init_config_commands=[])
+        routers = [device for device in testbed if device.type == "C8000V"]
+        unreachable = connect_devices(routers)
+        if unreachable:
+            self.failed(f"Unreachable devices: {', '.join(unreachable)}")
 
 class Testcase(aetest.Testcase):
 
@@ -44,7 +46,7 @@ class Testcase(aetest.Testcase):
         for device_name in testbed.devices:
             device = testbed.devices[device_name]
             
-            if device.type == "C8000V":
+            if device.type == "C8000V" and reachable(device, steps):
                 with steps.start("Checking CDP", continue_=True) as step_cdp:
                     if "Total cdp entries displayed : 0" in device.execute(f"show cdp neighbor GigabitEthernet2 detail"):
                         step_cdp.failed("No CDP neighbors found")
@@ -75,5 +77,4 @@ class CommonCleanup(aetest.CommonCleanup):
     
     @aetest.subsection
     def disconnect(self,testbed):
-        for device in testbed:
-            device.disconnect()        
+        disconnect_devices(testbed)        
@@ -0,0 +1,357 @@
+"""
+Copyright (c) 2024 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+from genie.metaparser.util.exceptions import SchemaEmptyParserError
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+import threading
+import hashlib
+import logging
+import json
+import os
+import re
+
+log = logging.getLogger(__name__)
+
+CONNECT_CONCURRENCY = int(os.getenv("PYATS_CONNECT_CONCURRENCY", 20))
+CONNECT_TIMEOUT = int(os.getenv("PYATS_CONNECT_TIMEOUT", 60))
+
+def connect_devices(devices, concurrency=CONNECT_CONCURRENCY, timeout=CONNECT_TIMEOUT):
+    """
+    Connects to devices in parallel. A device that cannot be reached is logged and left
+    disconnected instead of aborting the run.
+
+    :param devices: Devices to connect to, e.g. the testbed.
+    :param concurrency: Maximum number of connections opened at the same time (PYATS_CONNECT_CONCURRENCY).
+    :param timeout: Seconds to wait for each device (PYATS_CONNECT_TIMEOUT).
+    :return: Names of the unreachable devices.
+    """
+
+    def connect(device):
+        try:
+            device.connect(init_config_commands=[], connection_timeout=timeout)
+        except Exception as e:
+            log.warning(f"{device.name}: unreachable ({e})")
+            return device.name
+
+    devices = list(devices)
+    if not devices:
+        return []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return [name for name in executor.map(connect, devices) if name]
+
+def disconnect_devices(devices, concurrency=CONNECT_CONCURRENCY):
+    """
+    Disconnects from all connected devices in parallel.
+
+    :param devices: Devices to disconnect from, e.g. the testbed.
+    :param concurrency: Maximum number of connections closed at the same time.
+    """
+
+    def disconnect(device):
+        try:
+            device.disconnect()
+        except Exception as e:
+            log.warning(f"{device.name}: disconnect failed ({e})")
+
+    devices = [device for device in devices if device.is_connected()]
+    if not devices:
+        return
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(disconnect, devices))
+
+def reachable(device, steps):
+    """
+    Checks that a device is connected. An unreachable device gets a failed step in the calling test,
+    so it fails every test it is part of while the other devices are still checked.
+
+    :param device: The device.
+    :param steps: The steps of the calling test.
+    :return: True if the device is connected.
+    """
+
+    if device.is_connected():
+        return True
+    with steps.start(f"Connecting to {device.name}", continue_=True) as step:
+        step.failed(f"{device.name} is unreachable")
+    return False
+
+TERRAFORM_DIR = os.getenv("TERRAFORM_DIR", "../terraform")
+CHECK_CONCURRENCY = int(os.getenv("PYATS_CHECK_CONCURRENCY", 10))
+COLLECTION_MODE = os.getenv("PYATS_COLLECTION_MODE", "narrow")
+
+STP_STATES = {"forwarding": "FWD", "blocking": "BLK", "listening": "LIS", "learning": "LRN", "disabled": "DIS"}
+
+class DeviceOutputs:
+    """
+    This class runs commands on one device and keeps their results for the rest of the run, so each command
+    runs at most once per device until the configuration changes. A command that raised re-raises the same
+    exception whenever its result is read in the current test, so it errors the step that uses it.
+
+    The vrf, vlan_name, switchport, interface and stp_states accessors either run one narrow show command per
+    object or, with PYATS_COLLECTION_MODE=bulk, parse show vrf, show vlan, show interfaces switchport,
+    show interfaces and show spanning-tree once per device and answer every check from that index.
+    """
+
+    devices = {}
+    lock = threading.Lock()
+
+    def __init__(self, device):
+        self.device = device
+        self.bulk = COLLECTION_MODE == "bulk"
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def of(cls, device):
+        """
+        Returns the outputs of a device for this run.
+
+        :param device: The device.
+        :return: DeviceOutputs shared by all tests of the run.
+        """
+
+        with cls.lock:
+            if device.name not in cls.devices:
+                cls.devices[device.name] = cls(device)
+            return cls.devices[device.name]
+
+    def run(self, key, function, *args):
+        if key in self.results:
+            self.hits += 1
+        else:
+            self.misses += 1
+            try:
+                self.results[key] = function(*args)
+            except Exception as e:
+                self.results[key] = e
+        result = self.results[key]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def execute(self, command):
+        return self.run(("execute", command), self.device.execute, command)
+
+    def parse(self, command):
+        return self.run(("parse", command), self.device.parse, command)
+
+    def parse_all(self, command):
+        def parse():
+            try:
+                return self.device.parse(command)
+            except SchemaEmptyParserError:
+                return {}
+
+        return self.run(("parse", command), parse)
+
+    def vrf(self, vrf_id):
+        """
+        :return: The VRF as parsed by show vrf, None if it is not configured.
+        """
+
+        vrf_id = str(vrf_id)
+        if self.bulk:
+            return self.parse_all("show vrf").get("vrf", {}).get(vrf_id)
+        if self.execute(f"show vrf {vrf_id}") == f"% No VRF named {vrf_id}":
+            return None
+        return self.parse(f"show vrf {vrf_id}")["vrf"][vrf_id]
+
+    def vlan_name(self, vlan_id):
+        """
+        :return: The name of the VLAN, None if it is not configured.
+        """
+
+        if self.bulk:
+            vlan = self.parse_all("show vlan").get("vlans", {}).get(str(vlan_id))
+            return vlan["name"] if vlan else None
+        if self.execute(f"show vlan id {vlan_id}") == f"VLAN id {vlan_id} not found in current VLAN database":
+            return None
+        return self.parse(f"show vlan id {vlan_id}")["vlan-name"]
+
+    def switchport(self, interface):
+        if self.bulk:
+            return self.parse_all("show interfaces switchport")[interface]
+        return self.parse(f"show interface {interface} switchport")[interface]
+
+    def interface(self, interface):
+        if self.bulk:
+            return self.parse_all("show interfaces")[interface]
+        return self.parse(f"show interface {interface}")[interface]
+
+    def stp_states(self, interface):
+        """
+        :return: Spanning-tree state of the interface per VLAN, e.g. {"VLAN0010": "FWD"}.
+        """
+
+        if not self.bulk:
+            stp = self.parse(f"show spanning-tree interface {interface}")
+            return {vlan: details["status"] for vlan, details in stp["vlan"].items()}
+        return self.run(("index", "show spanning-tree"), self.__index_stp).get(interface, {})
+
+    def __index_stp(self):
+        index = {}
+        for mode in self.parse_all("show spanning-tree").values():
+            for vlan_id, vlan in mode.get("vlans", {}).items():
+                for name, port in vlan.get("interfaces", {}).items():
+                    state = STP_STATES.get(port["port_state"], port["port_state"].upper())
+                    index.setdefault(name, {})[f"VLAN{int(vlan_id):04d}"] = state
+        return index
+
+    def configure(self, config):
+        """
+        Configures the device and drops all outputs, as they may no longer match the device state.
+
+        :param config: The configuration to apply.
+        :return: The device output.
+        """
+
+        self.invalidate()
+        return self.device.configure(config)
+
+    def invalidate(self):
+        self.results.clear()
+
+    def forget_errors(self):
+        self.results = {
+            key: result for key, result in self.results.items() if not isinstance(result, Exception)
+        }
+
+def log_cache_stats():
+    """
+    Logs how many command results were answered from the per-device cache during this run.
+    """
+
+    hits = sum(outputs.hits for outputs in DeviceOutputs.devices.values())
+    misses = sum(outputs.misses for outputs in DeviceOutputs.devices.values())
+    if hits + misses:
+        log.info(f"Command cache: {hits} hits, {misses} misses ({100 * hits / (hits + misses):.1f}% hit rate)")
+
+def collect_per_device(devices, collect, concurrency=CHECK_CONCURRENCY):
+    """
+    Runs collect(outputs) for each device in a bounded worker pool so the slow device round trips overlap.
+    The steps then verify the collected outputs one device after the other, keeping the report hierarchy.
+    Commands collect did not reach, e.g. because an earlier one failed, run when a step reads them.
+
+    :param devices: Devices to collect from.
+    :param collect: Function running the commands a test needs through the DeviceOutputs passed to it.
+    :param concurrency: Maximum number of devices collected from at the same time (PYATS_CHECK_CONCURRENCY).
+    :return: DeviceOutputs per device name.
+    """
+
+    def run(device):
+        outputs = DeviceOutputs.of(device)
+        outputs.forget_errors()
+        try:
+            collect(outputs)
+        except Exception as e:
+            log.warning(f"{device.name}: collection stopped ({e})")
+        return outputs
+
+    devices = list(devices)
+    if not devices:
+        return {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return {outputs.device.name: outputs for outputs in executor.map(run, devices)}
+
+class ExpectedState:
+    """
+    This class loads the routing and switching terraform variables at most once per job and indexes the
+    state the service checks expect, so a check looks up its device instead of scanning every router.
+    """
+
+    def __init__(self, terraform_dir=TERRAFORM_DIR):
+        self.terraform_dir = terraform_dir
+
+    def __load(self, name):
+        with open(os.path.join(self.terraform_dir, name, "terraform.tfvars.json")) as file:
+            return json.load(file)
+
+    @cached_property
+    def routing_vars(self):
+        return self.__load("routing")
+
+    @cached_property
+    def switching_vars(self):
+        return self.__load("switching")
+
+    @cached_property
+    def vpns(self):
+        """
+        :return: IDs of all VPNs in the order of the routing variables.
+        """
+
+        return [vpn["id"] for vpn in self.routing_vars["vpns"]]
+
+    @cached_property
+    def router_vrfs(self):
+        """
+        :return: Expected VRF interface and IP per router host name and VRF ID,
+            e.g. {"site-01-r01": {"10": {"interface": "GigabitEthernet3", "ip": "10.0.0.1/24"}}}.
+        """
+
+        routers = {}
+        for router in self.routing_vars["router"]:
+            variables = router["variables"]
+            vrfs = routers.setdefault(variables["system_host_name"], {})
+            for key, value in variables.items():
+                match = re.fullmatch(r"vpn(.+)_interface", key)
+                if match:
+                    vrfs[match.group(1)] = {
+                        "interface": value,
+                        "ip": variables.get(f"vpn{match.group(1)}_ipv4_address"),
+                    }
+        return routers
+
+    @cached_property
+    def vlans(self):
+        """
+        :return: Expected name and access interfaces per VLAN ID in the order of the switching variables,
+            e.g. {10: {"name": "USERS", "interfaces": ["GigabitEthernet1/0/2"]}}.
+        """
+
+        return {
+            vlan["id"]: {
+                "name": vlan["name"],
+                "interfaces": [f"{interface['type']}{interface['name']}" for interface in vlan["interfaces"]],
+            }
+            for vlan in self.switching_vars["vlans"]
+        }
+
+@lru_cache(maxsize=None)
+def expected_state():
+    """
+    :return: The ExpectedState shared by all tests of the job.
+    """
+
+    return ExpectedState()
+
+def canonical(data):
+    """
+    :return: The data as it reads back from a JSON baseline, e.g. with integer keys turned into strings.
+    """
+
+    return json.loads(json.dumps(data))
+
+def digest(data):
+    """
+    :return: SHA-256 of the canonical JSON form of data, independent of key order.
+    """
+
+    content = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2024 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+from baselines import BaselineStore
+from genie.utils.diff import Diff
+import tempfile
+import click
+import json
+import time
+import os
+
+def vrf_tree(vrfs, interfaces):
+    return {
+        "info": {
+            "vrfs": {
+                str(vrf): {
+                    "route_distinguisher": f"65000:{vrf}",
+                    "address_family": {"ipv4 unicast": {"route_targets": {f"65000:{vrf}": {"rt_type": "both"}}}},
+                    "interfaces": {f"GigabitEthernet{vrf}.{i}": {"vrf": str(vrf)} for i in range(interfaces)},
+                }
+                for vrf in range(1, vrfs + 1)
+            }
+        }
+    }
+
+def vlan_tree(vlans, interfaces):
+    return {
+        "info": {
+            "vlans": {
+                vlan: {
+                    "vlan_id": vlan,
+                    "name": f"VLAN{vlan:04d}",
+                    "state": "active",
+                    "interfaces": {f"GigabitEthernet1/0/{i}": {"switchport_mode": "access"} for i in range(interfaces)},
+                }
+                for vlan in range(1, vlans + 1)
+            }
+        }
+    }
+
+def previous(path, data):
+    """
+    Drift check as lifecycle_diff.py did it before: load the baseline, diff it and diff it again for printing.
+    """
+
+    with open(path) as file:
+        baseline = json.load(file)
+    diff = Diff(baseline, data)
+    diff.findDiff()
+    diff = Diff(baseline, data)
+    diff.findDiff()
+    str(diff)
+
+def measure(function, *args, runs=3):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return round(min(timings) * 1000, 1)
+
+@click.command()
+@click.option("--vrfs", default=500, help="Number of VRFs in the VRF tree")
+@click.option("--vlans", default=2000, help="Number of VLANs in the VLAN tree")
+@click.option("--interfaces", default=20, help="Number of interfaces per VRF or VLAN")
+@click.option("--runs", default=3, help="Runs per measurement, the fastest is reported")
+def cli(vrfs, vlans, interfaces, runs):
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, tree in (("vrf", vrf_tree(vrfs, interfaces)), ("vlan", vlan_tree(vlans, interfaces))):
+            path = os.path.join(directory, f"base-{name}_device.json")
+            with open(path, "w") as file:
+                json.dump(tree, file, indent=4)
+            drifted = json.loads(json.dumps(tree))
+            first = next(iter(drifted["info"][f"{name}s"].values()))
+            first["interfaces"] = {}
+
+            store = BaselineStore(root=os.path.join(directory, "store"))
+            store.save(name, "device", tree)
+
+            def load_json():
+                with open(path) as file:
+                    json.load(file)
+
+            def load_latest():
+                BaselineStore(root=store.root).load(name, "device")
+
+            def find_drift(data):
+                BaselineStore(root=store.root).find_drift(name, "device", data)
+
+            report[name] = {
+                "json_bytes": os.path.getsize(path),
+                "snapshot_bytes": os.path.getsize(store.snapshot_path(store.latest(name, "device")["digest"])),
+                "json_load_ms": measure(load_json, runs=runs),
+                "snapshot_load_ms": measure(load_latest, runs=runs),
+                "previous_ms": measure(previous, path, tree, runs=runs),
+                "previous_drift_ms": measure(previous, path, drifted, runs=runs),
+                "no_drift_ms": measure(find_drift, tree, runs=runs),
+                "drift_ms": measure(find_drift, drifted, runs=runs),
+            }
+    print(json.dumps(report, indent=4))
+
+if __name__ == "__main__":
+    cli()
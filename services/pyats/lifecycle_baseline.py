@@ -16,42 +16,49 @@ or implied.
 """
 
 from pyats import aetest
-import json
+from common import connect_devices, disconnect_devices, reachable
+from baselines import BaselineStore, learn
 
 class CommonSetup(aetest.CommonSetup):
     
     @aetest.subsection
     def connect(self, testbed):
-        for device in testbed:
-            device.connect(init_config_commands=[])
+        unreachable = connect_devices(testbed)
+        if unreachable:
+            self.failed(f"Unreachable devices: {', '.join(unreachable)}")
 
 class Testcase(aetest.Testcase):
 
+    @aetest.setup
+    def setup(self):
+        self.store = BaselineStore()
+
     @aetest.test
     def router_vrf(self, testbed, steps):        
         for device_name in testbed.devices:
             device = testbed.devices[device_name]
         
-            if device.type == "C8000V":
-                vrf = device.learn("vrf")
+            if device.type == "C8000V" and reachable(device, steps):
+                vrf = learn(device, "vrf")
 
-                with open(f"/var/baseline/base-vrf_{device.name}.json", 'w') as file:
-                    json.dump(vrf.to_dict(), file, indent=4)
+                self.store.save("vrf", device.name, vrf)
     
     @aetest.test
     def switch_vlan(self, testbed, steps):
         for device_name in testbed.devices:
             device = testbed.devices[device_name]
         
-            if device.type == "C9KV-UADP-8P":
-                vlan = device.learn("vlan")
+            if device.type == "C9KV-UADP-8P" and reachable(device, steps):
+                vlan = learn(device, "vlan")
 
-                with open(f"/var/baseline/base-vlan_{device.name}.json", 'w') as file:
-                    json.dump(vlan.to_dict(), file, indent=4)
+                self.store.save("vlan", device.name, vlan)
                                 
 class CommonCleanup(aetest.CommonCleanup):
     
+    @aetest.subsection
+    def prune(self):
+        BaselineStore().prune()
+
     @aetest.subsection
     def disconnect(self,testbed):
-        for device in testbed:
-            device.disconnect()        
+        disconnect_devices(testbed)        
@@ -16,67 +16,61 @@ or implied.
 """
 
 from pyats import aetest
-from genie.utils.diff import Diff
-import json
+from common import connect_devices, disconnect_devices, reachable
+from baselines import BaselineStore, learn
 
 class CommonSetup(aetest.CommonSetup):
     
     @aetest.subsection
     def connect(self, testbed):
-        for device in testbed:
-            device.connect(init_config_commands=[])
+        unreachable = connect_devices(testbed)
+        if unreachable:
+            self.failed(f"Unreachable devices: {', '.join(unreachable)}")
 
 class Testcase(aetest.Testcase):
 
+    @aetest.setup
+    def setup(self):
+        self.store = BaselineStore()
+
     @aetest.test
     def router_vrf(self, testbed, steps):        
         for device_name in testbed.devices:
             device = testbed.devices[device_name]
         
-            if device.type == "C8000V":
-                
-                with open(f"/var/baseline/base-vrf_{device.name}.json") as file:
-                    base_vrf = json.load(file)
-
+            if device.type == "C8000V" and reachable(device, steps):
+                diff = None
                 with steps.start(f"Learning VRF configuration on {device.name}", continue_=True) as step_vrf:
-                    vrf = device.learn("vrf")
+                    vrf = learn(device, "vrf")
 
                     with step_vrf.start(f"Comparing to baseline", continue_=True) as step_diff:
                 
-                        diff = Diff(base_vrf, vrf.to_dict())
-                        diff.findDiff()
+                        diff = self.store.find_drift("vrf", device.name, vrf)
                         
-                        if diff.diffs:
+                        if diff is not None:
                             step_diff.failed(f"Found configuration drift {diff}")
 
-                diff = Diff(base_vrf, vrf.to_dict())
-                diff.findDiff()
-                print(diff)
+                if diff is not None:
+                    print(diff)
     
     @aetest.test
     def switch_vlan(self, testbed, steps):
         for device_name in testbed.devices:
             device = testbed.devices[device_name]
         
-            if device.type == "C9KV-UADP-8P":
-                
-                with open(f"/var/baseline/base-vlan_{device.name}.json") as file:
-                        base_vlan = json.load(file)
-                
+            if device.type == "C9KV-UADP-8P" and reachable(device, steps):
                 with steps.start(f"Learning VLAN configuration on {device.name}", continue_=True) as step_vlan:
-                    vlan = device.learn("vlan")
+                    vlan = learn(device, "vlan")
 
                     with step_vlan.start(f"Comparing to baseline", continue_=True) as step_diff:
                 
-                        diff = Diff(base_vlan, vlan.to_dict())
-                        diff.findDiff()
+                        diff = self.store.find_drift("vlan", device.name, vlan)
                         
-                        if diff.diffs:
+                        if diff is not None:
                             step_diff.failed(f"Found configuration drift {diff}")
                                     
 class CommonCleanup(aetest.CommonCleanup):
     
     @aetest.subsection
     def disconnect(self,testbed):
-        for device in testbed:
-            device.disconnect()        
+        disconnect_devices(testbed)        
@@ -16,109 +16,122 @@ or implied.
 """
 
 from pyats import aetest
-import json
+from common import collect_per_device, connect_devices, disconnect_devices, expected_state, log_cache_stats, reachable
 import os
 
 class CommonSetup(aetest.CommonSetup):
     
     @aetest.subsection
     def connect(self, testbed):
-        for device in testbed:
-            device.connect(init_config_commands=[])
+        unreachable = connect_devices(testbed)
+        if unreachable:
+            self.failed(f"Unreachable devices: {', '.join(unreachable)}")
 
 class Testcase(aetest.Testcase):
 
     @aetest.test
     def router_vrf(self, testbed, steps):
-        with open('../terraform/routing/terraform.tfvars.json') as file:
-            routing_vars = json.load(file)
-        
-        for device_name in testbed.devices:
-            device = testbed.devices[device_name]
-        
-            if device.type == "C8000V":
-                for vpn in routing_vars["vpns"]:
-                    vpn_id = vpn["id"]
-                    with steps.start(f"Check VRF {vpn_id} on device {device.name}", continue_=True) as step_vrf:        
-                        if device.execute(f"show vrf {vpn_id}") == f"% No VRF named {vpn_id}":
-                            step_vrf.failed(f"VRF {vpn_id} not configured")
+        state = expected_state()
+        routers = [device for device in testbed if device.type == "C8000V" and reachable(device, steps)]
+
+        def collect(output):
+            vrfs = state.router_vrfs.get(output.device.name, {})
+            for vpn_id in state.vpns:
+                if output.vrf(vpn_id) is not None and str(vpn_id) in vrfs:
+                    output.interface(vrfs[str(vpn_id)]["interface"])
+
+        outputs = collect_per_device(routers, collect)
+        for device in routers:
+            output = outputs[device.name]
+
+            vrfs = state.router_vrfs.get(device.name, {})
+            for vpn_id in state.vpns:
+                with steps.start(f"Check VRF {vpn_id} on device {device.name}", continue_=True) as step_vrf:        
+                    vrf = output.vrf(vpn_id)
+                    if vrf is None:
+                        step_vrf.failed(f"VRF {vpn_id} not configured")
+                    
+                    if str(vpn_id) in vrfs:
+                        expected_interface = vrfs[str(vpn_id)]["interface"]
+                        expected_ip = vrfs[str(vpn_id)]["ip"]
+
+                        with step_vrf.start(f"Check interface {expected_interface}", continue_=True) as step_interface:
+                            if expected_interface not in vrf["interfaces"]:
+                                step_interface.failed(f"Interface {expected_interface} not configured")
+                            interface_details = output.interface(expected_interface)
                         
-                        vrf = device.parse(f"show vrf {vpn_id}")
-                        for router in routing_vars["router"]:
-                            if router["variables"]["system_host_name"] == device.name:
-                                expected_interface = router["variables"][f"vpn{vpn_id}_interface"]
-                                expected_ip = router["variables"][f"vpn{vpn_id}_ipv4_address"]
-
-                                with step_vrf.start(f"Check interface {expected_interface}", continue_=True) as step_interface:
-                                    if expected_interface not in vrf["vrf"][str(vpn_id)]["interfaces"]:
-                                        step_interface.failed(f"Interface {expected_interface} not configured")
-                                    interface_details = device.parse(f"show interface {expected_interface}")
-                                
-                                    with step_interface.start(f"Check ip {expected_ip}", continue_=True) as step_ip:
-                                        if expected_ip not in interface_details[expected_interface]["ipv4"]:
-                                            step_ip.failed(f"IP {expected_ip} not configured")
+                            with step_interface.start(f"Check ip {expected_ip}", continue_=True) as step_ip:
+                                if expected_ip not in interface_details["ipv4"]:
+                                    step_ip.failed(f"IP {expected_ip} not configured")
 
-                                    with step_interface.start("Check line-protocol state", continue_=True) as step_state:
-                                        if interface_details[expected_interface]["line_protocol"] != "up":
-                                            step_state.failed("Line protocol down")                          
+                            with step_interface.start("Check line-protocol state", continue_=True) as step_state:
+                                if interface_details["line_protocol"] != "up":
+                                    step_state.failed("Line protocol down")                          
 
     @aetest.test
     def switch_vlan(self, testbed, steps):
-        with open('../terraform/switching/terraform.tfvars.json') as file:
-            switching_vars = json.load(file)
-
-        for device_name in testbed.devices:
-            device = testbed.devices[device_name]
-        
-            if device.type == "C9KV-UADP-8P":
-                for vlan in switching_vars["vlans"]:
-                    vlan_id = vlan["id"]
-                    vlan_name = vlan["name"]
-                    vlan_interfaces = vlan["interfaces"]
+        vlans = expected_state().vlans
+        uplink = os.getenv("SWITCH_UPLINK")
+        switches = [device for device in testbed if device.type == "C9KV-UADP-8P" and reachable(device, steps)]
+
+        def collect(output):
+            for vlan_id, vlan in vlans.items():
+                if output.vlan_name(vlan_id) is None:
+                    continue
+                for intf in vlan["interfaces"]:
+                    output.switchport(intf)
+                    output.interface(intf)
+                    output.stp_states(intf)
+                output.stp_states(uplink)
+
+        outputs = collect_per_device(switches, collect)
+        for device in switches:
+            output = outputs[device.name]
+
+            for vlan_id, vlan in vlans.items():
+                vlan_name = vlan["name"]
+                
+                with steps.start(f"Check VLAN {vlan_id} on device {device.name}", continue_=True) as step_vlan:
+                    configured_name = output.vlan_name(vlan_id)
+                    if configured_name is None:
+                        step_vlan.failed(f"VLAN {vlan_id} not configured")        
                     
-                    with steps.start(f"Check VLAN {vlan_id} on device {device.name}", continue_=True) as step_vlan:
-                        if device.execute(f"show vlan id {vlan_id}") == f"VLAN id {vlan_id} not found in current VLAN database":
-                            step_vlan.failed(f"VLAN {vlan_id} not configured")        
-                        
-                        vlan = device.parse(f"show vlan id {vlan_id}")
-                        with step_vlan.start(f"Check VLAN name {vlan_name}", continue_=True) as step_name:
-                            if vlan_name != vlan["vlan-name"]:
-                                step_name.failed("VLAN name mismatch")
-
-                        for interface in vlan_interfaces:
-                            intf = f"{interface['type']}{interface['name']}"
-                            with step_vlan.start(f"Checking {intf}", continue_=True) as step_intf:
-                                switchport = device.parse(f"show interface {intf} switchport")
-                        
-                                with step_intf.start("Check switchport mode", continue_=True) as step_intf_mode:
-                                    if switchport[intf]["operational_mode"] != "static access":
-                                        step_intf_mode.failed("Not in mode access")
+                    with step_vlan.start(f"Check VLAN name {vlan_name}", continue_=True) as step_name:
+                        if vlan_name != configured_name:
+                            step_name.failed("VLAN name mismatch")
 
-                                with step_intf.start("Check access vlan", continue_=True) as step_intf_vlan:
-                                    if switchport[intf]["access_vlan"] != str(vlan_id):
-                                        step_intf_vlan.failed("Wrong access vlan")
-                                
-                                with step_intf.start("Check line-protocol state", continue_=True) as step_intf_state:
-                                    interface_details = device.parse(f"show interface {intf}")
-                                    if interface_details[intf]["line_protocol"] != "up":
-                                        step_intf_state.failed("Line protocol down")
-
-                                with step_intf.start("Check STP forwarding", continue_=True) as step_intf_stp:
-                                    stp = device.parse(f"show spanning-tree interface {intf}")
-                                    if f"VLAN0{vlan_id}" not in stp["vlan"] or stp["vlan"][f"VLAN0{vlan_id}"]["status"] != "FWD":
-                                        step_intf_stp.failed("Spanning-tree not in forwarding state")
+                    for intf in vlan["interfaces"]:
+                        with step_vlan.start(f"Checking {intf}", continue_=True) as step_intf:
+                            switchport = output.switchport(intf)
+                    
+                            with step_intf.start("Check switchport mode", continue_=True) as step_intf_mode:
+                                if switchport["operational_mode"] != "static access":
+                                    step_intf_mode.failed("Not in mode access")
+
+                            with step_intf.start("Check access vlan", continue_=True) as step_intf_vlan:
+                                if switchport["access_vlan"] != str(vlan_id):
+                                    step_intf_vlan.failed("Wrong access vlan")
                             
-                            with step_vlan.start("Check STP forwarding on Uplink", continue_=True) as step_uplink_stp:
-                                    uplink = os.getenv("SWITCH_UPLINK")
-                                    stp = device.parse(f"show spanning-tree interface {uplink}")
-                                    if f"VLAN0{vlan_id}" not in stp["vlan"] or stp["vlan"][f"VLAN0{vlan_id}"]["status"] != "FWD":
-                                        step_uplink_stp.failed("Spanning-tree not in forwarding state")
-                                    
+                            with step_intf.start("Check line-protocol state", continue_=True) as step_intf_state:
+                                interface_details = output.interface(intf)
+                                if interface_details["line_protocol"] != "up":
+                                    step_intf_state.failed("Line protocol down")
+
+                            with step_intf.start("Check STP forwarding", continue_=True) as step_intf_stp:
+                                stp = output.stp_states(intf)
+                                if stp.get(f"VLAN0{vlan_id}") != "FWD":
+                                    step_intf_stp.failed("Spanning-tree not in forwarding state")
+                        
+                        with step_vlan.start("Check STP forwarding on Uplink", continue_=True) as step_uplink_stp:
+                                stp = output.stp_states(uplink)
+                                if stp.get(f"VLAN0{vlan_id}") != "FWD":
+                                    step_uplink_stp.failed("Spanning-tree not in forwarding state")
+                                
 class CommonCleanup(aetest.CommonCleanup):
     
     @aetest.subsection
     def disconnect(self,testbed):
-        for device in testbed:
-            device.disconnect()        
+        log_cache_stats()
+        disconnect_devices(testbed)        
 
 
@@ -0,0 +1,99 @@
+"""
+Copyright (c) 2024 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Cisco Sample
+Code License, Version 1.1 (the "License"). You may obtain a copy of the
+License at
+
+               https://developer.cisco.com/docs/licenses
+
+All use of the material herein must be in accordance with the terms of
+the License. All rights not expressly granted by the License are
+reserved. Unless required by applicable law or agreed to separately in
+writing, software distributed under the License is distributed on an "AS
+IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+or implied.
+"""
+
+from contextlib import contextmanager
+import hashlib
+import fcntl
+import json
+import time
+import os
+
+
+class FileCache:
+    """
+    This class persists a JSON document with an expiry time so that it can be reused across CLI invocations.
+    Cache files are stored in BRKOPS_CACHE_DIR (default ~/.cache/brkops-2357) and are only readable by the owner.
+    """
+
+    def __init__(self, name=str, *scope) -> None:
+        """
+        Initialises the cache file location.
+
+        :param name: Name of the cache.
+        :param scope: Values the cached data depends on, e.g. host and user.
+        """
+
+        directory = os.getenv(
+            "BRKOPS_CACHE_DIR",
+            os.path.join(os.path.expanduser("~"), ".cache", "brkops-2357"),
+        )
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        key = hashlib.sha256(repr(scope).encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(directory, f"{name}-{key}.json")
+        self.expires = 0
+
+    def load(self):
+        """
+        Reads the cached data.
+
+        :return: The data, None if there is no cache or it expired.
+        """
+
+        try:
+            with open(self.path) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires", 0) < time.time():
+            return None
+        self.expires = entry["expires"]
+        return entry["data"]
+
+    def save(self, data, ttl=None):
+        """
+        Writes the data atomically with owner-only permissions.
+
+        :param data: The data to cache.
+        :param ttl: Seconds until the data expires, keeps the current expiry if omitted.
+        """
+
+        if ttl is not None:
+            self.expires = time.time() + ttl
+
+        temp_path = f"{self.path}.{os.getpid()}"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as file:
+            json.dump({"expires": self.expires, "data": data}, file)
+        os.replace(temp_path, self.path)
+
+    @contextmanager
+    def lock(self):
+        """
+        Holds an exclusive lock on the cache across processes, so a read, change and write of the data
+        does not lose the changes of a concurrent CLI invocation.
+        """
+
+        fd = os.open(f"{self.path}.lock", os.O_WRONLY | os.O_CREAT, 0o600)
+        with os.fdopen(fd, "w") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            yield
+
+    def delete(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
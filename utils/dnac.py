@@ -15,13 +15,70 @@ IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
 or implied.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from dnacentersdk import api
+from dnacentersdk.api.authentication import Authentication
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from cache import FileCache
+import threading
 import logging
+import base64
+import random
+import json
 import click
 import time
+import sys
 import os
 
 
+class CachedTokenAuthentication(Authentication):
+    """
+    This class reuses a Catalyst Center token persisted by a previous CLI invocation for the first login of
+    a DNACenterAPI session. Any further login, e.g. after the API answered 401, requests a new token and persists it.
+    """
+
+    token_cache = None
+
+    def authentication_api(self, username, password, encoded_auth=None):
+        if not getattr(self, "cache_used", False):
+            self.cache_used = True
+            token = self.token_cache.load()
+            if token:
+                logging.info(msg="Authentication: reusing cached token")
+                return SimpleNamespace(Token=token)
+
+        response = super().authentication_api(
+            username=username, password=password, encoded_auth=encoded_auth
+        )
+        token = response.Token
+        self.token_cache.save(token, ttl=token_lifetime(token))
+        return SimpleNamespace(Token=token)
+
+
+def token_lifetime(token, default=3000):
+    """
+    Reads the remaining lifetime of a JWT from its exp claim, with a safety margin of one minute.
+
+    :param token: The JWT.
+    :param default: Lifetime in seconds if the token has no readable exp claim.
+    :return: Seconds the token can be reused.
+    """
+
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+        return max(0, claims["exp"] - time.time() - 60)
+    except (IndexError, KeyError, TypeError, ValueError):
+        return default
+
+
+# DNACenterAPI logs in through the Authentication class of its module.
+api.Authentication = CachedTokenAuthentication
+
+
 class Dnac:
     """
     This class manages interactions with Cisco Catalyst Center using the dnacentersdk.
@@ -33,62 +90,264 @@ class Dnac:
         self.host = os.getenv("DNAC_URL")
         self.user = os.getenv("DNAC_USER")
         self.password = os.getenv("DNAC_PASSWORD")
+        logging.basicConfig(level=logging.INFO)
+
+        start = time.perf_counter()
+        CachedTokenAuthentication.token_cache = FileCache(
+            "dnac-token", self.host, self.user
+        )
         self.session = api.DNACenterAPI(
             base_url=self.host, username=self.user, password=self.password, verify=False
         )
-        logging.basicConfig(level=logging.INFO)
+        logging.info(msg=f"Session ready in {time.perf_counter() - start:.2f}s")
+
+        self.device_cache = FileCache("dnac-devices", self.host)
+        self.device_cache_ttl = int(os.getenv("DNAC_DEVICE_CACHE_TTL", 3600))
+        self.device_ids = None
+        self.device_lock = threading.Lock()
+        self.rate_lock = threading.Lock()
+        self.next_request = time.monotonic()
+        self.events = None
+        self.event_fallback = int(os.getenv("DNAC_EVENT_FALLBACK_INTERVAL", 60))
+
+    def start_event_receiver(self, port=int):
+        """
+        Starts a local HTTP receiver for Catalyst Center event notifications (webhook destination).
+        While it runs, waits re-check their devices or tasks as soon as any event arrives and
+        otherwise only poll every DNAC_EVENT_FALLBACK_INTERVAL seconds.
 
-    def get_onboarding_state(self, device=str, wait=False):
+        :param port: TCP port to listen on.
         """
-        Retrieves the onboarding state of a device. Optionally waits for the device to be provisioned.
 
-        :param device: Serial number of the device.
-        :param wait: If True, continuously checks until the device is provisioned.
-        :return: The state of the device.
+        events = threading.Event()
+        token = os.getenv("DNAC_WEBHOOK_TOKEN")
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if token and self.headers.get("X-Webhook-Token") != token:
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                try:
+                    event = json.loads(body).get("eventId", "unknown")
+                except (ValueError, AttributeError):
+                    event = "unknown"
+                logging.info(msg=f"Event received: {event}")
+                events.set()
+                self.send_response(200)
+                self.end_headers()
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.events = events
+        logging.info(msg=f"Event receiver listening on port {port}")
+
+    def __sleep(self, delay, remaining):
         """
+        Waits before the next poll. With an event receiver the wait ends early when an event arrives
+        and polling slows down to the fallback interval.
 
-        if wait:
-            while True:
-                response = self.session.device_onboarding_pnp.get_device_list(
-                    serial_number=device
-                )
-                state = response[0]["deviceInfo"]["state"]
+        :param delay: Polling delay in seconds.
+        :param remaining: Seconds until the deadline.
+        """
+
+        if self.events is None:
+            time.sleep(min(remaining, delay))
+            return
+        self.events.wait(min(remaining, max(delay, self.event_fallback)))
+        self.events.clear()
+
+    def get_onboarding_state(self, devices=list, wait=False, timeout=1800):
+        """
+        Retrieves the onboarding state of devices with one PnP query per round. Optionally waits for the
+        devices to be provisioned, backing off exponentially with jitter, and logs state changes as they happen.
+
+        :param devices: Serial numbers of the devices.
+        :param wait: If True, checks until all devices are provisioned, failed or the timeout expires.
+        :param timeout: Maximum time to wait in seconds.
+        :return: The state per serial number.
+        """
 
-                if state == "Provisioned":
-                    logging.info(msg=f"Onboarding state: {state}")
-                    return state
+        states = {}
+        pending = set(devices)
+        deadline = time.monotonic() + timeout
+        delay = 2
 
-                time.sleep(5)
-        else:
+        while True:
             response = self.session.device_onboarding_pnp.get_device_list(
-                serial_number=device
+                serial_number=list(pending)
             )
-            state = response[0]["deviceInfo"]["state"]
+            for device in response:
+                serial = device["deviceInfo"]["serialNumber"]
+                state = device["deviceInfo"]["state"]
+                if states.get(serial) != state:
+                    logging.info(msg=f"Onboarding state {serial}: {state}")
+                states[serial] = state
+                if state in ("Provisioned", "Error"):
+                    pending.discard(serial)
+
+            remaining = deadline - time.monotonic()
+            if not wait or not pending or remaining <= 0:
+                break
+
+            self.__sleep(random.uniform(delay / 2, delay), remaining)
+            delay = min(delay * 2, 60)
+
+        for serial in pending:
+            states.setdefault(serial, "Unknown")
+            if wait:
+                logging.error(
+                    msg=f"Onboarding state {serial}: timeout in {states[serial]}"
+                )
+        return states
 
-        logging.info(msg=f"Onboarding state: {state}")
-        return state
+    def refresh_device_cache(self, page_size=500):
+        """
+        Loads the serial number to device ID mapping of the whole inventory with one paginated fetch
+        and persists it for DNAC_DEVICE_CACHE_TTL seconds.
+
+        :param page_size: Number of devices per request.
+        :return: Device ID per serial number.
+        """
+
+        device_ids = {}
+        offset = 1
+        while True:
+            response = self.session.devices.get_device_list(
+                offset=offset, limit=page_size
+            )
+            for device in response["response"]:
+                for serial in (device.get("serialNumber") or "").split(","):
+                    if serial.strip():
+                        device_ids[serial.strip()] = device["id"]
+            if len(response["response"]) < page_size:
+                break
+            offset += page_size
+
+        with self.device_cache.lock():
+            self.device_cache.save(device_ids, ttl=self.device_cache_ttl)
+        self.device_ids = device_ids
+        logging.info(msg=f"Device cache: {len(device_ids)} devices loaded")
+        return device_ids
+
+    def __cached_device_ids(self):
+        with self.device_lock:
+            if self.device_ids is None:
+                self.device_ids = self.device_cache.load() or {}
+            return self.device_ids
+
+    def __forget_devices(self, device_ids=list):
+        with self.device_lock, self.device_cache.lock():
+            cached = self.device_cache.load()
+            current = self.device_ids if cached is None else cached
+            self.device_ids = {
+                serial: id
+                for serial, id in (current or {}).items()
+                if id not in device_ids
+            }
+            if cached is not None:
+                self.device_cache.save(self.device_ids)
 
     def get_device(self, device):
         """
-        Retrieves a device ID based on its serial number.
+        Retrieves a device ID based on its serial number, from the device cache if possible. Otherwise the
+        device is queried on its own and the result is added to the cache.
 
         :param device: Serial number of the device.
         :return: Device ID if found, False otherwise.
         """
 
+        device_ids = self.__cached_device_ids()
+        if device in device_ids:
+            return device_ids[device]
+
         response = self.session.devices.get_device_list(serial_number=device)
         try:
             device_id = response["response"][0]["id"]
-            return device_id
         except Exception as e:
             logging.error(msg="Device not found")
             return False
 
-    def delete_device(self, device_id=str):
+        with self.device_lock, self.device_cache.lock():
+            cached = self.device_cache.load()
+            self.device_ids = {} if cached is None else cached
+            self.device_ids[device] = device_id
+            self.device_cache.save(
+                self.device_ids, ttl=self.device_cache_ttl if cached is None else None
+            )
+        return device_id
+
+    def __throttle(self, rate):
+        """
+        Blocks until the next request is allowed so that requests are spread evenly at the given rate.
+
+        :param rate: Maximum requests per second.
+        """
+
+        with self.rate_lock:
+            now = time.monotonic()
+            start = max(self.next_request, now)
+            self.next_request = start + 1 / rate
+        time.sleep(start - now)
+
+    def __wait_for_tasks(self, tasks=dict, timeout=600, rate=None):
+        """
+        Polls Catalyst Center tasks in one loop until each of them succeeded, failed or the timeout expired.
+        A failed status lookup leaves the task pending, so transient errors only end in a timeout.
+
+        :param tasks: Task ID to the name the result is reported under.
+        :param timeout: Maximum time to wait in seconds.
+        :param rate: Maximum status lookups per second, unlimited if omitted.
+        :return: The result per name.
+        """
+
+        results = {}
+        pending = dict(tasks)
+        deadline = time.monotonic() + timeout
+
+        while pending:
+            for task_id, name in list(pending.items()):
+                if rate:
+                    self.__throttle(rate)
+                try:
+                    task = self.session.task.get_task_by_id(task_id=task_id)["response"]
+                except Exception as e:
+                    logging.warning(
+                        msg=f"Task state {name}: lookup failed, retrying ({e})"
+                    )
+                    continue
+                if task.get("isError"):
+                    results[name] = (
+                        f"Failed: {task.get('failureReason', task.get('progress'))}"
+                    )
+                elif task.get("endTime"):
+                    results[name] = task.get("progress", "Completed")
+                else:
+                    continue
+                logging.info(msg=f"Task state {name}: {results[name]}")
+                del pending[task_id]
+
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            self.__sleep(5, remaining)
+
+        for name in pending.values():
+            results[name] = "Timeout"
+            logging.error(msg=f"Task state {name}: {results[name]}")
+        return results
+
+    def delete_device(self, device_id=str, timeout=600):
         """
         Deletes a device from Catalyst Center.
 
         :param device_id: ID of the device to be deleted.
+        :param timeout: Maximum time to wait for the deletion in seconds.
         :return: State of the operation.
         """
 
@@ -96,20 +355,76 @@ class Dnac:
             id=device_id, is_force_delete=True
         )
         task_id = response["response"]["taskId"]
+        state = self.__wait_for_tasks({task_id: device_id}, timeout=timeout)[device_id]
+        if not state.startswith(("Failed", "Timeout")):
+            self.__forget_devices([device_id])
+        return state
 
-        while True:
-            response = self.session.task.get_task_by_id(task_id=task_id)
-            state = response["response"]["progress"]
-            if state == "Network device deleted successfully":
-                logging.info(msg=f"Delete state: {state}")
-                return state
-            time.sleep(5)
+    def delete_devices(self, devices=list, concurrency=5, rate=2.0, timeout=600):
+        """
+        Deletes devices from Catalyst Center. Deletions are submitted concurrently at a limited rate
+        and all resulting tasks are tracked in one polling loop. If several serial numbers are not in the
+        device cache, the whole inventory is loaded once instead of querying each of them.
+
+        :param devices: Serial numbers of the devices to be deleted.
+        :param concurrency: Maximum number of deletions submitted in parallel.
+        :param rate: Maximum deletion and task status requests per second.
+        :param timeout: Maximum time to wait for all deletions in seconds.
+        :return: State of the operation per serial number.
+        """
+
+        def submit(serial):
+            device_id = self.get_device(serial)
+            if not device_id:
+                return serial, None, "Not found"
+            self.__throttle(rate)
+            try:
+                response = self.session.devices.delete_device_by_id(
+                    id=device_id, is_force_delete=True
+                )
+            except Exception as e:
+                logging.error(msg=f"Delete {serial} failed: {e}")
+                return serial, None, f"Failed: {e}"
+            device_ids[serial] = device_id
+            return serial, response["response"]["taskId"], None
+
+        cached = self.__cached_device_ids()
+        if len([serial for serial in devices if serial not in cached]) > 1:
+            self.refresh_device_cache()
+
+        results = {}
+        tasks = {}
+        device_ids = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for serial, task_id, error in executor.map(submit, devices):
+                if task_id:
+                    tasks[task_id] = serial
+                else:
+                    results[serial] = error
+
+        results.update(self.__wait_for_tasks(tasks, timeout=timeout, rate=rate))
+        self.__forget_devices(
+            [
+                device_ids[serial]
+                for serial in tasks.values()
+                if not results[serial].startswith(("Failed", "Timeout"))
+            ]
+        )
+        return results
 
 
 @click.group()
+@click.option(
+    "--event-port",
+    type=int,
+    default=None,
+    help="Receive Catalyst Center event notifications on this port while waiting",
+)
 @click.pass_context
-def cli(ctx):
+def cli(ctx, event_port):
     ctx.ensure_object(Dnac)
+    if event_port:
+        ctx.obj.start_event_receiver(event_port)
 
 
 @cli.group()
@@ -123,20 +438,50 @@ def get():
 
 
 @device.command(name="delete")
-@click.argument("device_serial")
+@click.argument("device_serial", nargs=-1, required=True)
+@click.option("--concurrency", default=5, help="Deletions submitted in parallel")
+@click.option(
+    "--rate", default=2.0, help="Maximum deletion and task status requests per second"
+)
+@click.option("--timeout", default=600, help="Maximum time to wait in seconds")
+@click.pass_obj
+def delete_device(obj, device_serial, concurrency, rate, timeout):
+    results = obj.delete_devices(
+        devices=device_serial, concurrency=concurrency, rate=rate, timeout=timeout
+    )
+    for serial, state in results.items():
+        click.echo(f"{serial}: {state}")
+    failed = [
+        serial
+        for serial, state in results.items()
+        if state.startswith(("Failed", "Timeout"))
+    ]
+    skipped = [serial for serial, state in results.items() if state == "Not found"]
+    click.echo(
+        f"Deleted {len(results) - len(failed) - len(skipped)} of {len(results)} devices, "
+        f"{len(skipped)} not found"
+    )
+    if failed:
+        sys.exit(1)
+    return results
+
+
+@device.command(name="refresh-cache")
 @click.pass_obj
-def delete_device(obj, device_serial):
-    device_id = obj.get_device(device_serial)
-    if device_id:
-        return obj.delete_device(device_id)
+def refresh_device_cache(obj):
+    return obj.refresh_device_cache()
 
 
 @get.command(name="onboarding-state")
-@click.argument("device_serial")
-@click.option("--wait", is_flag=True, help="Wait for device to be provisioned")
+@click.argument("device_serial", nargs=-1, required=True)
+@click.option("--wait", is_flag=True, help="Wait for devices to be provisioned")
+@click.option("--timeout", default=1800, help="Maximum time to wait in seconds")
 @click.pass_obj
-def get_onboarding_state(obj, device_serial, wait):
-    return obj.get_onboarding_state(device=device_serial, wait=wait)
+def get_onboarding_state(obj, device_serial, wait, timeout):
+    states = obj.get_onboarding_state(devices=device_serial, wait=wait, timeout=timeout)
+    if wait and any(state != "Provisioned" for state in states.values()):
+        sys.exit(1)
+    return states
 
 
 if __name__ == "__main__":
@@ -18,12 +18,137 @@ or implied.
 from vmanage.api.authentication import Authentication
 from vmanage.api.device_templates import DeviceTemplates
 from vmanage.api.http_methods import HttpMethods
-from vmanage.api.utilities import Utilities
 from vmanage.api.device import Device
+from concurrent.futures import Future
+from cache import FileCache
+import threading
+import requests
+import logging
 import click
 import json
+import time
 import os
 
+FINISHED_ACTION_STATES = ("done", "failed", "failure", "aborted")
+
+
+class ActionTracker:
+    """
+    This class follows many vManage actions in one background loop until their summary status is done or
+    failed. Scheduled or pending actions keep being polled. Each action is polled at its own interval,
+    which is reset to min_interval while its devices make progress and grows up to max_interval while
+    nothing changes. Results are delivered through futures so callers can keep submitting other
+    template operations while earlier ones are still running.
+    """
+
+    def __init__(self, session, host=str, min_interval=2, max_interval=30) -> None:
+        self.session = session
+        self.host = host
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.actions = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def track(self, action_id=str, timeout=3600):
+        """
+        Starts following an action.
+
+        :param action_id: The action ID returned by vManage.
+        :param timeout: Seconds after which the action is reported as timed out.
+        :return: A future resolving to the action outcome.
+        """
+
+        now = time.monotonic()
+        with self.lock:
+            action = self.actions.get(action_id)
+            if action is None:
+                action = {
+                    "future": Future(),
+                    "start": now,
+                    "deadline": now + timeout,
+                    "next": now,
+                    "interval": self.min_interval,
+                    "progress": None,
+                }
+                self.actions[action_id] = action
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.__run, daemon=True)
+                self.thread.start()
+        self.wakeup.set()
+        return action["future"]
+
+    def __run(self):
+        while True:
+            with self.lock:
+                if not self.actions:
+                    self.thread = None
+                    return
+                now = time.monotonic()
+                due = [
+                    action_id
+                    for action_id, action in self.actions.items()
+                    if action["next"] <= now
+                ]
+
+            for action_id in due:
+                self.__poll(action_id)
+
+            self.wakeup.clear()
+            with self.lock:
+                if not self.actions:
+                    continue
+                delay = min(action["next"] for action in self.actions.values())
+            self.wakeup.wait(max(0, delay - time.monotonic()))
+
+    def __poll(self, action_id=str):
+        action = self.actions[action_id]
+        now = time.monotonic()
+        try:
+            response = HttpMethods(
+                session=self.session,
+                url=f"https://{self.host}/dataservice/device/action/status/{action_id}",
+            ).request(method="GET")
+            status = response["json"]["summary"]["status"]
+            data = response["json"].get("data", [])
+        except Exception as e:
+            logging.warning(msg=f"Action {action_id}: status request failed: {e}")
+            status, data = "in_progress", None
+
+        finished = str(status).lower() in FINISHED_ACTION_STATES
+        if not finished and now < action["deadline"]:
+            progress = data and sorted(
+                (device.get("uuid"), device.get("status")) for device in data
+            )
+            if data is not None and progress != action["progress"]:
+                action["progress"] = progress
+                action["interval"] = self.min_interval
+            else:
+                action["interval"] = min(action["interval"] * 2, self.max_interval)
+            action["next"] = now + action["interval"]
+            return
+
+        devices = {}
+        for device in data or []:
+            uuid = device.get("uuid", device.get("deviceID"))
+            devices[uuid] = {
+                "status": device.get("status", status),
+                "activity": device.get("activity", []),
+            }
+        result = {
+            "action_id": action_id,
+            "status": status if finished else "Timeout",
+            "elapsed": round(now - action["start"], 2),
+            "devices": devices,
+        }
+        with self.lock:
+            del self.actions[action_id]
+        logging.info(
+            msg=f"Action {action_id}: {result['status']} in {result['elapsed']}s"
+        )
+        action["future"].set_result(result)
+
 
 class Sdwan:
     """
@@ -35,9 +160,146 @@ class Sdwan:
         self.host = os.getenv("VMANAGE_HOST")
         self.user = os.getenv("VMANAGE_USER")
         self.password = os.getenv("VMANAGE_PASSWORD")
-        self.session = Authentication(
+        self.session_cache = FileCache("vmanage-session", self.host, self.user)
+        self.session_ttl = int(os.getenv("VMANAGE_SESSION_TTL", 1800))
+        self.login_lock = threading.Lock()
+        self.local = threading.local()
+        logging.basicConfig(level=logging.INFO)
+
+        start = time.perf_counter()
+        self.session = self.__session()
+        logging.info(msg=f"Session ready in {time.perf_counter() - start:.2f}s")
+
+        self.device_cache = FileCache("vmanage-devices", self.host)
+        self.device_cache_ttl = int(os.getenv("VMANAGE_DEVICE_CACHE_TTL", 300))
+        self.device_index = None
+        self.device_refreshed = False
+        self.device_hits = 0
+        self.device_misses = 0
+        self.tracker = ActionTracker(session=self.session, host=self.host)
+
+    def __login(self):
+        """
+        Logs in to vManage and persists the session cookies and XSRF token for later CLI invocations.
+
+        :return: The session credentials.
+        """
+
+        session = Authentication(
             host=self.host, user=self.user, password=self.password
         ).login()
+        token = session.headers.get("X-XSRF-TOKEN")
+        credentials = {
+            "cookies": session.cookies.get_dict(),
+            "token": token.decode("utf-8") if isinstance(token, bytes) else token,
+        }
+        self.session_cache.save(credentials, ttl=self.session_ttl)
+        return credentials
+
+    def __apply(self, session, credentials):
+        session.cookies.clear()
+        session.cookies.update(credentials["cookies"])
+        if credentials["token"]:
+            session.headers["X-XSRF-TOKEN"] = credentials["token"]
+
+    def __session(self):
+        """
+        Creates a session from cached credentials if available, logging in otherwise. The session logs in
+        again and repeats the request once if vManage rejects the credentials.
+
+        :return: The requests session.
+        """
+
+        credentials = self.session_cache.load()
+        if credentials:
+            logging.info(msg="Authentication: reusing cached session")
+        else:
+            credentials = self.__login()
+
+        session = requests.Session()
+        session.verify = False
+        self.__apply(session, credentials)
+        session.hooks["response"].append(self.__relogin)
+        return session
+
+    def __relogin(self, response, *args, **kwargs):
+        expired = response.status_code in (401, 403) or (
+            response.headers.get("Content-Type", "").startswith("text/html")
+            and "j_security_check" in response.text
+        )
+        if not expired or getattr(self.local, "relogin", False):
+            return response
+
+        self.local.relogin = True
+        try:
+            with self.login_lock:
+                # Only log in if no other thread did since this request was sent
+                session_id = self.session.cookies.get("JSESSIONID")
+                sent_cookies = response.request.headers.get("Cookie", "")
+                if not session_id or f"JSESSIONID={session_id}" in sent_cookies:
+                    logging.info(
+                        msg="Authentication: session expired, logging in again"
+                    )
+                    self.__apply(self.session, self.__login())
+                request = response.request.copy()
+                request.headers.pop("Cookie", None)
+                request.prepare_cookies(self.session.cookies)
+                if "X-XSRF-TOKEN" in self.session.headers:
+                    request.headers["X-XSRF-TOKEN"] = self.session.headers[
+                        "X-XSRF-TOKEN"
+                    ]
+            return self.session.send(request, **kwargs)
+        finally:
+            self.local.relogin = False
+
+    def refresh_device_cache(self):
+        """
+        Loads the status of all devices with one request, persists it for VMANAGE_DEVICE_CACHE_TTL
+        seconds and indexes it by uuid, host-name and system-ip.
+
+        :return: Number of devices loaded.
+        """
+
+        devices = Device(session=self.session, host=self.host).get_device_status_list()
+        self.device_cache.save(devices, ttl=self.device_cache_ttl)
+        self.__index_devices(devices)
+        self.device_refreshed = True
+        logging.info(msg=f"Device cache: {len(devices)} devices loaded")
+        return len(devices)
+
+    def __index_devices(self, devices=list):
+        self.device_index = {
+            key: {device[key]: device for device in devices if key in device}
+            for key in ("uuid", "host-name", "system-ip")
+        }
+
+    def lookup_device(self, value=str, key="uuid"):
+        """
+        Looks up a device in the device status cache. Unknown devices trigger one refresh of the
+        cache per run, in case the device was added since the cache was loaded.
+
+        :param value: The value to match.
+        :param key: One of uuid, host-name or system-ip.
+        :return: Device status, empty if not found.
+        """
+
+        if self.device_index is None:
+            devices = self.device_cache.load()
+            if devices is None:
+                self.refresh_device_cache()
+            else:
+                self.__index_devices(devices)
+
+        device = self.device_index[key].get(value)
+        if device is not None:
+            self.device_hits += 1
+            return device
+
+        self.device_misses += 1
+        if not self.device_refreshed:
+            self.refresh_device_cache()
+            device = self.device_index[key].get(value)
+        return device or {}
 
     def get_device(self, device_uuid=str):
         """
@@ -47,9 +309,7 @@ class Sdwan:
         :return: Device details.
         """
 
-        devices = Device(session=self.session, host=self.host)
-        device = devices.get_device_status(value=device_uuid, key="uuid")
-        return device
+        return self.lookup_device(value=device_uuid, key="uuid")
 
     def get_devices_by_template(self, template_name=str):
         """
@@ -75,19 +335,18 @@ class Sdwan:
         Waits for a task (e.g., device detachment) to complete based on its ID.
 
         :param id: The action ID to wait for.
-        :return: Completion status.
+        :return: Completion status with per-device outcomes and elapsed time.
         """
 
-        utils = Utilities(session=self.session, host=self.host)
-        return utils.waitfor_action_completion(action_id=id)
+        return self.tracker.track(action_id=id).result()
 
-    def detach_devices(self, devices=list, device_type="vedge"):
+    def submit_detach(self, devices=list, device_type="vedge"):
         """
-        Detaches a list of devices from their template.
+        Starts detaching a list of devices from their template without waiting for completion.
 
         :param devices: List of device UUIDs to detach.
         :param device_type: Type of the devices, default is 'vedge'.
-        :return: Detachment status or error.
+        :return: A future resolving to the detachment status.
         """
 
         devices_payload = []
@@ -102,16 +361,80 @@ class Sdwan:
         response = url.request(method="POST", payload=payload)
 
         if response["status_code"] != 200:
-            return response["error"]
+            raise Exception(response["error"])
+
+        return self.tracker.track(action_id=response["json"]["id"])
+
+    def detach_devices(self, devices=list, device_type="vedge"):
+        """
+        Detaches a list of devices from their template.
+
+        :param devices: List of device UUIDs to detach.
+        :param device_type: Type of the devices, default is 'vedge'.
+        :return: Detachment status or error.
+        """
+
+        try:
+            return self.submit_detach(devices, device_type=device_type).result()
+        except Exception as e:
+            return str(e)
+
+    def detach_devices_in_chunks(
+        self, devices=list, device_type="vedge", chunk_size=50, max_in_flight=2
+    ):
+        """
+        Detaches many devices from their templates. Devices are split into chunks of at most chunk_size
+        per detach action and at most max_in_flight actions run at the same time. All running actions
+        are followed by the action tracker, so a new chunk is submitted as soon as any action finishes.
+
+        :param devices: List of device UUIDs to detach.
+        :param device_type: Type of the devices, default is 'vedge'.
+        :param chunk_size: Maximum number of devices per detach action.
+        :param max_in_flight: Maximum number of detach actions running in parallel.
+        :return: Detachment status, action ID and elapsed time per device UUID.
+        """
 
-        task_id = response["json"]["id"]
-        return self.wait_for_completion(id=task_id)
+        devices = list(dict.fromkeys(devices))
+        chunks = [
+            devices[i : i + chunk_size] for i in range(0, len(devices), chunk_size)
+        ]
+
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+        futures = []
+        results = {}
+        for chunk in chunks:
+            in_flight.acquire()
+            try:
+                future = self.submit_detach(chunk, device_type=device_type)
+            except Exception as e:
+                in_flight.release()
+                for device in chunk:
+                    results[device] = {"status": f"Failed: {e}"}
+                continue
+            future.add_done_callback(lambda _: in_flight.release())
+            futures.append((chunk, future))
+
+        for chunk, future in futures:
+            result = future.result()
+            for device in chunk:
+                outcome = result["devices"].get(device, {})
+                results[device] = {
+                    "status": outcome.get("status", result["status"]),
+                    "action_id": result["action_id"],
+                    "elapsed": result["elapsed"],
+                }
+        return results
 
 
 @click.group()
 @click.pass_context
 def cli(ctx):
     ctx.ensure_object(Sdwan)
+    ctx.call_on_close(
+        lambda: logging.info(
+            msg=f"Device cache: {ctx.obj.device_hits} hits, {ctx.obj.device_misses} misses"
+        )
+    )
 
 
 @cli.group()
@@ -119,6 +442,17 @@ def template():
     pass
 
 
+@cli.group()
+def device():
+    pass
+
+
+@device.command(name="refresh-cache")
+@click.pass_obj
+def refresh_device_cache(obj):
+    return obj.refresh_device_cache()
+
+
 @template.group()
 def detach():
     pass
@@ -146,5 +480,48 @@ def detach_device(obj, device_uuid):
         print("device not found")
 
 
+@detach.command(name="templates")
+@click.argument("template_names", nargs=-1, required=True)
+@click.option("--chunk-size", default=50, help="Maximum devices per detach action")
+@click.option("--max-in-flight", default=2, help="Maximum parallel detach actions")
+@click.pass_obj
+def detach_all_devices_from_templates(obj, template_names, chunk_size, max_in_flight):
+    devices = []
+    for template_name in template_names:
+        devices.extend(obj.get_devices_by_template(template_name) or [])
+    print_results(
+        obj.detach_devices_in_chunks(
+            devices, chunk_size=chunk_size, max_in_flight=max_in_flight
+        )
+    )
+
+
+@detach.command(name="devices")
+@click.argument("device_uuids", nargs=-1, required=True)
+@click.option("--chunk-size", default=50, help="Maximum devices per detach action")
+@click.option("--max-in-flight", default=2, help="Maximum parallel detach actions")
+@click.pass_obj
+def detach_many_devices(obj, device_uuids, chunk_size, max_in_flight):
+    devices = [device for device in device_uuids if obj.get_device(device)]
+    results = obj.detach_devices_in_chunks(
+        devices, chunk_size=chunk_size, max_in_flight=max_in_flight
+    )
+    for device in device_uuids:
+        results.setdefault(device, {"status": "Not found"})
+    print_results(results)
+
+
+def print_results(results):
+    for device, result in results.items():
+        if "action_id" in result:
+            click.echo(
+                f"{device}: {result['status']} (action {result['action_id']}, {result['elapsed']}s)"
+            )
+        else:
+            click.echo(f"{device}: {result['status']}")
+    succeeded = [result for result in results.values() if result["status"] == "Success"]
+    click.echo(f"Detached {len(succeeded)} of {len(results)} devices")
+
+
 if __name__ == "__main__":
     cli()